@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
-import asyncio
 import argparse
 import os
+from src.fetcher import run_async
 from src.lsj_scraper import LSJScraper
 import logging
 
@@ -24,7 +24,8 @@ async def run_scraper(args):
         # Run the crawler
         await scraper.run_full_crawl(
             limit_letters=args.limit_letters,
-            limit_groups=args.limit_groups
+            limit_groups=args.limit_groups,
+            concurrency=args.concurrency
         )
         
         # Export the results
@@ -44,6 +45,9 @@ def main():
     parser.add_argument("--delay", type=float, default=1.2,
                         help="Delay between requests in seconds (default: 1.2)")
     
+    parser.add_argument("--concurrency", type=int, default=3,
+                        help="Maximum number of entry group pages fetched at once (default: 3)")
+    
     parser.add_argument("--output", type=str, default="lsj_lexicon_export.json",
                         help="Output file path (default: lsj_lexicon_export.json)")
     
@@ -53,7 +57,7 @@ def main():
     args = parser.parse_args()
     
     # Run the scraper
-    asyncio.run(run_scraper(args))
+    run_async(run_scraper(args))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,27 +1,119 @@
 import sqlite3
-import json
 import logging
-from typing import Dict, Optional, List, Set
+import threading
+import orjson
+import zstandard
+from typing import Dict, Iterable, Iterator, Optional, List, Set, Tuple
 from pathlib import Path
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Per-connection tuning; journal_mode is persistent and set once at init
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA wal_autocheckpoint=1000',
+    # Wait for another scraper's write to finish instead of failing with "database is locked"
+    'PRAGMA busy_timeout=5000',
+)
+
+# Prepared statements kept per connection; the hot paths reuse a handful of SQL strings
+STATEMENT_CACHE_SIZE = 256
+
+# Entry JSON and cached pages are stored zstd-compressed; definitions HTML is highly repetitive
+COMPRESSION_LEVEL = 3
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# zstd contexts are not thread-safe and reads also run on worker threads, so keep one pair per thread
+_zstd = threading.local()
+
+def _compress(payload: bytes) -> bytes:
+    """Compress a payload for storage"""
+    if not hasattr(_zstd, 'compressor'):
+        _zstd.compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+    return _zstd.compressor.compress(payload)
+
+def _decompress(value) -> bytes:
+    """Return a stored payload as bytes, whichever format it was written in"""
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    # Converters always receive bytes, so zstd frames are told apart by their header
+    # from the plain JSON text that databases created before compression hold
+    if value[:4] == ZSTD_MAGIC:
+        if not hasattr(_zstd, 'decompressor'):
+            _zstd.decompressor = zstandard.ZstdDecompressor()
+        return _zstd.decompressor.decompress(value)
+    return value
+
+def _encode_data(data: Dict) -> bytes:
+    """Serialize and compress an entry for storage"""
+    return _compress(orjson.dumps(data))
+
+def _decode_raw(value) -> bytes:
+    """Return stored entry JSON as bytes"""
+    return _decompress(value)
+
+# Let the driver parse columns tagged [JSON] on read
+sqlite3.register_converter('JSON', lambda value: orjson.loads(_decode_raw(value)))
+
 class Database:
     def __init__(self, db_path: str = "logeion.sqlite"):
         self.db_path = db_path
+        self.conn: Optional[sqlite3.Connection] = None
+        # WAL lets readers share the connection; only writers need serializing
+        self._write_lock = threading.Lock()
         self._ensure_db_exists()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection with the per-connection PRAGMAs applied"""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            detect_types=sqlite3.PARSE_COLNAMES,
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def close(self):
+        """Close the long-lived database connection"""
+        if self.conn:
+            self.optimize()
+            self.conn.close()
+            self.conn = None
+
+    def optimize(self):
+        """Refresh query planner statistics, e.g. after a bulk load"""
+        try:
+            with self._write_lock:
+                # Keep ANALYZE bounded on large tables
+                self.conn.execute('PRAGMA analysis_limit=1000')
+                self.conn.execute('PRAGMA optimize')
+        except Exception as e:
+            logger.error(f"Error optimizing database: {str(e)}")
+
     def _ensure_db_exists(self):
         """Create database and tables if they don't exist"""
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = self._connect()
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self.conn as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
             conn.executescript('''
                 CREATE TABLE IF NOT EXISTS entries (
                     id INTEGER PRIMARY KEY,
                     lemma TEXT NOT NULL UNIQUE,
-                    data TEXT NOT NULL,
+                    data BLOB NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
 
@@ -31,32 +123,53 @@ class Database:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
 
-                CREATE INDEX IF NOT EXISTS idx_entries_lemma ON entries(lemma);
-                CREATE INDEX IF NOT EXISTS idx_failed_lemmas_lemma ON failed_lemmas(lemma);
+                CREATE TABLE IF NOT EXISTS fetched (
+                    url TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+
+                -- The UNIQUE constraints already index lemma; drop the duplicates
+                -- that older databases were created with
+                DROP INDEX IF EXISTS idx_entries_lemma;
+                DROP INDEX IF EXISTS idx_failed_lemmas_lemma;
             ''')
 
     def store_entry(self, lemma: str, data: Dict) -> bool:
         """Store a lexicon entry in the database"""
+        return self.store_entries([(lemma, data)])
+
+    def store_entries(self, entries: Iterable[Tuple[str, Dict]]) -> bool:
+        """Store a batch of lexicon entries in a single transaction"""
+        # Serialize and compress up front so the write transaction stays short
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute('''
-                    INSERT OR REPLACE INTO entries (lemma, data)
+            rows = [(lemma, _encode_data(data)) for lemma, data in entries]
+        except Exception as e:
+            logger.error(f"Error serializing batch of entries: {str(e)}")
+            return False
+        if not rows:
+            return True
+        try:
+            with self._write_lock, self.conn as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany('''
+                    INSERT INTO entries (lemma, data)
                     VALUES (?, ?)
-                ''', (lemma, json.dumps(data, ensure_ascii=False)))
+                    ON CONFLICT(lemma) DO UPDATE SET data = excluded.data
+                ''', rows)
                 return True
         except Exception as e:
-            logger.error(f"Error storing entry for {lemma}: {str(e)}")
+            logger.error(f"Error storing batch of {len(rows)} entries: {str(e)}")
             return False
 
     def get_entry(self, lemma: str) -> Optional[Dict]:
         """Retrieve a lexicon entry from the database"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute('SELECT data FROM entries WHERE lemma = ?', (lemma,))
-                row = cursor.fetchone()
-                if row:
-                    return json.loads(row[0])
-                return None
+            cursor = self.conn.execute('SELECT data AS "data [JSON]" FROM entries WHERE lemma = ?', (lemma,))
+            row = cursor.fetchone()
+            if row:
+                return row[0]
+            return None
         except Exception as e:
             logger.error(f"Error retrieving entry for {lemma}: {str(e)}")
             return None
@@ -64,17 +177,84 @@ class Database:
     def get_all_entries(self) -> Dict[str, Dict]:
         """Get all entries from the database"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute('SELECT lemma, data FROM entries')
-                return {row[0]: json.loads(row[1]) for row in cursor.fetchall()}
+            return dict(self.iter_entries())
         except Exception as e:
             logger.error(f"Error retrieving all entries: {str(e)}")
             return {}
 
+    def iter_entries(self) -> Iterator[Tuple[str, Dict]]:
+        """Yield (lemma, data) pairs with data parsed into a dict"""
+        yield from self.conn.execute('SELECT lemma, data AS "data [JSON]" FROM entries')
+
+    def iter_entries_raw(self) -> Iterator[Tuple[str, bytes]]:
+        """Yield (lemma, data) pairs with data as serialized JSON bytes"""
+        for lemma, data in self.conn.execute('SELECT lemma, data FROM entries'):
+            yield lemma, _decode_raw(data)
+
+    def export_to_json(self, output_path: str) -> int:
+        """Stream all entries to a JSON file keyed by lemma, one row at a time"""
+        count = 0
+        with open(output_path, 'wb') as f:
+            f.write(b'{')
+            for lemma, data in self.iter_entries_raw():
+                # data is already serialized JSON, so it is spliced in as-is
+                f.write(b',\n  ' if count else b'\n  ')
+                f.write(orjson.dumps(lemma))
+                f.write(b': ')
+                f.write(data)
+                count += 1
+            f.write(b'\n}\n')
+        return count
+
+    def export_to_jsonl(self, output_path: str) -> int:
+        """Stream all entries to a JSON Lines file, one {"lemma", "data"} object per line"""
+        count = 0
+        with open(output_path, 'wb') as f:
+            for lemma, data in self.iter_entries_raw():
+                f.write(b'{"lemma": ')
+                f.write(orjson.dumps(lemma))
+                f.write(b', "data": ')
+                f.write(data)
+                f.write(b'}\n')
+                count += 1
+        return count
+
+    def get_fetched(self, url: str, max_age: Optional[float] = None) -> Optional[str]:
+        """Retrieve the cached body of a previously fetched URL, ignoring it once older than max_age seconds"""
+        try:
+            if max_age is None:
+                cursor = self.conn.execute('SELECT body FROM fetched WHERE url = ?', (url,))
+            else:
+                cursor = self.conn.execute(
+                    "SELECT body FROM fetched WHERE url = ? AND fetched_at >= datetime('now', ?)",
+                    (url, f'-{max_age} seconds'),
+                )
+            row = cursor.fetchone()
+            if row:
+                return _decompress(row[0]).decode('utf-8')
+            return None
+        except Exception as e:
+            logger.error(f"Error retrieving cached page {url}: {str(e)}")
+            return None
+
+    def mark_fetched(self, url: str, body: str) -> bool:
+        """Record a fetched URL along with its compressed body"""
+        try:
+            with self._write_lock, self.conn as conn:
+                conn.execute('''
+                    INSERT INTO fetched (url, body)
+                    VALUES (?, ?)
+                    ON CONFLICT(url) DO UPDATE SET body = excluded.body, fetched_at = CURRENT_TIMESTAMP
+                ''', (url, _compress(body.encode('utf-8'))))
+                return True
+        except Exception as e:
+            logger.error(f"Error caching page {url}: {str(e)}")
+            return False
+
     def add_failed_lemma(self, lemma: str) -> bool:
         """Add a lemma to the failed lemmas table"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write_lock, self.conn as conn:
                 conn.execute('''
                     INSERT OR IGNORE INTO failed_lemmas (lemma)
                     VALUES (?)
@@ -87,7 +267,7 @@ class Database:
     def remove_failed_lemma(self, lemma: str) -> bool:
         """Remove a lemma from the failed lemmas table"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write_lock, self.conn as conn:
                 conn.execute('DELETE FROM failed_lemmas WHERE lemma = ?', (lemma,))
                 return True
         except Exception as e:
@@ -97,27 +277,34 @@ class Database:
     def get_failed_lemmas(self) -> Set[str]:
         """Get all failed lemmas"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute('SELECT lemma FROM failed_lemmas')
-                return {row[0] for row in cursor.fetchall()}
+            cursor = self.conn.execute('SELECT lemma FROM failed_lemmas')
+            return {row[0] for row in cursor.fetchall()}
         except Exception as e:
             logger.error(f"Error retrieving failed lemmas: {str(e)}")
             return set()
 
+    def get_lemmas(self) -> Set[str]:
+        """Get the keys of all stored entries"""
+        try:
+            cursor = self.conn.execute('SELECT lemma FROM entries')
+            return {row[0] for row in cursor}
+        except Exception as e:
+            logger.error(f"Error retrieving stored lemmas: {str(e)}")
+            return set()
+
     def get_stats(self) -> Dict[str, int]:
         """Get database statistics"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute('''
-                    SELECT 
-                        (SELECT COUNT(*) FROM entries) as total_entries,
-                        (SELECT COUNT(*) FROM failed_lemmas) as total_failed
-                ''')
-                row = cursor.fetchone()
-                return {
-                    'total_entries': row[0],
-                    'total_failed': row[1]
-                }
+            cursor = self.conn.execute('''
+                SELECT 
+                    (SELECT COUNT(*) FROM entries) as total_entries,
+                    (SELECT COUNT(*) FROM failed_lemmas) as total_failed
+            ''')
+            row = cursor.fetchone()
+            return {
+                'total_entries': row[0],
+                'total_failed': row[1]
+            }
         except Exception as e:
             logger.error(f"Error getting database stats: {str(e)}")
             return {'total_entries': 0, 'total_failed': 0} 
\ No newline at end of file
@@ -1,15 +1,15 @@
 #!/usr/bin/env python3
+import asyncio
 import os
-import json
-import time
 import logging
-from urllib.parse import quote, urljoin
+from urllib.parse import quote
 from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
 
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from selectolax.lexbor import LexborHTMLParser
 from database import Database
+from fetcher import PerseusFetcher, perseus_url
 
 # Set up logging
 logging.basicConfig(
@@ -20,102 +20,81 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 REQUEST_DELAY = 1.2  # Seconds between requests
-MAX_RETRIES = 3  # Maximum number of retries
+CONCURRENCY = 8  # Maximum number of concurrent requests
+BATCH_SIZE = 1000  # Entries buffered per database transaction
 
 # Base URL for the Perseus LSJ dictionary
-BASE_URL = "https://www.perseus.tufts.edu/hopper"
 LSJ_URL = "https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057"
 
-class LSJEntryScraper:
+# CSS selectors shared by the parse paths
+TEXT_SELECTOR = 'div.text'
+ENTRY_LIST_SELECTOR = 'div.entry_list'
+TITLE_SELECTOR = 'title'
+LINK_SELECTOR = 'a'
+
+# Letter pages, built once at import; the dicts are shared, so callers treat them as read-only
+LETTER_URL_PREFIX = "https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057:alphabetic%20letter="
+GREEK_LETTER_CODES = {
+    'Α': '*a', 'Β': '*b', 'Γ': '*g', 'Δ': '*d', 'Ε': '*e',
+    'Ζ': '*z', 'Η': '*h', 'Θ': '*q', 'Ι': '*i', 'Κ': '*k',
+    'Λ': '*l', 'Μ': '*m', 'Ν': '*n', 'Ξ': '*c', 'Ο': '*o',
+    'Π': '*p', 'Ρ': '*r', 'Σ': '*s', 'Τ': '*t', 'Υ': '*u',
+    'Φ': '*f', 'Χ': '*x', 'Ψ': '*y', 'Ω': '*w'
+}
+_GREEK_LETTERS: Tuple[Dict[str, str], ...] = tuple(
+    {'letter': letter, 'url': f"{LETTER_URL_PREFIX}{code}"}
+    for letter, code in GREEK_LETTER_CODES.items()
+)
+
+class LSJEntryScraper(PerseusFetcher):
     """Specialized scraper for Greek dictionary entries in the LSJ lexicon"""
     
-    def __init__(self, db_path: str = "lsj_entries.sqlite", delay: float = REQUEST_DELAY):
-        self.db = Database(db_path)
-        self.delay = delay
-        self.last_request_time = 0
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36',
-        })
-    
-    def _wait_for_delay(self):
-        """Ensure we respect the delay between requests."""
-        now = time.time()
-        time_since_last = now - self.last_request_time
-        if time_since_last < self.delay:
-            time.sleep(self.delay - time_since_last)
-        self.last_request_time = time.time()
-
-    def _make_request(self, url: str) -> Optional[str]:
-        """Make HTTP request with retry logic"""
-        for attempt in range(MAX_RETRIES):
-            try:
-                self._wait_for_delay()
-                response = self.session.get(url, timeout=30)
-                response.raise_for_status()
-                return response.text
-            except Exception as e:
-                logger.error(f"Request error on attempt {attempt+1}/{MAX_RETRIES}: {url} - {str(e)}")
-                if attempt == MAX_RETRIES - 1:
-                    return None
-                time.sleep(self.delay * (attempt + 1))
-        return None
+    def __init__(self, db_path: str = "lsj_entries.sqlite", delay: float = REQUEST_DELAY, keep_html: bool = True,
+                 refresh: bool = False):
+        super().__init__(Database(db_path), delay, BATCH_SIZE, refresh)
+        # Serializing the content subtree back to HTML is skipped when only text is wanted
+        self.keep_html = keep_html
     
     def get_greek_letters(self) -> List[Dict]:
         """Get the list of Greek alphabet letters with their URLs"""
-        base_url = "https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057:alphabetic%20letter="
-        
-        # Map of Greek letters to URL encoding
-        greek_letter_map = {
-            'Α': '*a', 'Β': '*b', 'Γ': '*g', 'Δ': '*d', 'Ε': '*e',
-            'Ζ': '*z', 'Η': '*h', 'Θ': '*q', 'Ι': '*i', 'Κ': '*k',
-            'Λ': '*l', 'Μ': '*m', 'Ν': '*n', 'Ξ': '*c', 'Ο': '*o',
-            'Π': '*p', 'Ρ': '*r', 'Σ': '*s', 'Τ': '*t', 'Υ': '*u',
-            'Φ': '*f', 'Χ': '*x', 'Ψ': '*y', 'Ω': '*w'
-        }
-        
-        greek_letters = []
-        for greek_letter, url_code in greek_letter_map.items():
-            greek_letters.append({
-                'letter': greek_letter,
-                'url': f"{base_url}{url_code}"
-            })
-            
-        return greek_letters
+        return list(_GREEK_LETTERS)
     
-    def parse_entry_groups(self, html: str) -> List[Dict]:
-        """Parse entry groups from a letter page"""
-        soup = BeautifulSoup(html, 'lxml')
+    def parse_entry_groups(self, tree: LexborHTMLParser) -> List[Dict]:
+        """Parse entry groups from an already parsed letter page"""
         groups = []
         
         # Look for entry groups in the content
-        entry_list = soup.select_one('div.entry_list')
+        entry_list = tree.css_first(ENTRY_LIST_SELECTOR)
         
         if entry_list:
             # This is a list of entries page
-            for link in entry_list.find_all('a'):
-                href = link.get('href')
-                text = link.get_text().strip()
+            for link in entry_list.css(LINK_SELECTOR):
+                href = link.attrs.get('href')
+                if not href:
+                    continue
+                text = link.text().strip()
                 
-                if href and text:
-                    full_url = href if href.startswith('http') else urljoin(BASE_URL, href)
+                if text:
+                    full_url = perseus_url(href)
                     groups.append({
                         'group': text,
                         'url': full_url
                     })
         else:
             # Try to find entry groups directly from the text
-            content = soup.select_one('div.text')
+            content = tree.css_first(TEXT_SELECTOR)
             if content:
-                for link in content.find_all('a'):
-                    href = link.get('href')
-                    text = link.get_text().strip()
+                for link in content.css(LINK_SELECTOR):
+                    href = link.attrs.get('href')
+                    if not href:
+                        continue
+                    text = link.text().strip()
                     
                     # Only include links that appear to be to dictionary entries
-                    if (href and text and 
+                    if (text and 
                         ('entry' in href or 'text:1999.04.0057' in href) and
                         not href.startswith('#')):
-                        full_url = href if href.startswith('http') else urljoin(BASE_URL, href) 
+                        full_url = perseus_url(href)
                         groups.append({
                             'group': text,
                             'url': full_url
@@ -125,136 +104,182 @@ class LSJEntryScraper:
     
     def parse_entry_content(self, html: str) -> Dict:
         """Parse the dictionary entry content"""
-        soup = BeautifulSoup(html, 'lxml')
+        tree = LexborHTMLParser(html)
         
         # Get the main content
-        content_div = soup.select_one('div.text')
+        content_div = tree.css_first(TEXT_SELECTOR)
         if not content_div:
             return {'text': '', 'html': ''}
         
         # Extract text and HTML
-        text_content = content_div.get_text().strip()
-        html_content = str(content_div)
+        text_content = content_div.text().strip()
+        html_content = content_div.html if self.keep_html else ''
         
         return {
             'text': text_content,
             'html': html_content
         }
     
+    def _letter_page_entry(self, letter_info: Dict, tree: LexborHTMLParser) -> Optional[Dict]:
+        """Queue the whole letter page as one entry when it holds the definitions"""
+        letter = letter_info['letter']
+        debug = logger.isEnabledFor(logging.DEBUG)
+        
+        # Log some debug info about the HTML
+        if debug:
+            title_node = tree.css_first(TITLE_SELECTOR)
+            title = title_node.text() if title_node else "No title"
+            logger.debug("Page title: %s", title)
+        
+        # Check if we got the expected content
+        text_div = tree.css_first(TEXT_SELECTOR)
+        if not text_div:
+            logger.warning("No div.text found on the page")
+            return None
+        
+        text = text_div.text()
+        if debug:
+            logger.debug("Found text div with content: %s...", text[:100])
+        
+        # Store the entire letter page as one entry since it contains the actual definitions
+        content = {
+            'text': text.strip(),
+            'html': text_div.html if self.keep_html else ''
+        }
+        
+        entry = {
+            'letter': letter,
+            'group': f"{letter} - Complete Letter Entries",
+            'url': letter_info['url'],
+            'content': content
+        }
+        
+        # Store in database
+        key = f"{letter}_complete"
+        self._queue_entry(key, entry)
+        
+        return entry
+    
+    def _alternate_url(self, letter: str) -> str:
+        """The Perseus site sometimes uses this format: entry for a specific letter"""
+        alt_url = f"https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057:entry={letter.lower()}"
+        logger.debug("Trying alternate URL: %s", alt_url)
+        return alt_url
+    
+    def _alternate_entry(self, letter: str, alt_url: str, alt_html: Optional[str]) -> Optional[Dict]:
+        """Queue the content of the alternate letter URL, if it has any"""
+        if not alt_html:
+            return None
+        
+        alt_text_div = LexborHTMLParser(alt_html).css_first(TEXT_SELECTOR)
+        if not alt_text_div:
+            return None
+        
+        logger.info(f"Found content with alternate URL")
+        content = {
+            'text': alt_text_div.text().strip(),
+            'html': alt_text_div.html if self.keep_html else ''
+        }
+        
+        entry = {
+            'letter': letter,
+            'group': f"{letter} - Alternate Format",
+            'url': alt_url,
+            'content': content
+        }
+        
+        # Store in database
+        key = f"{letter}_alternate"
+        self._queue_entry(key, entry)
+        
+        return entry
+    
+    def _group_entry(self, letter: str, group_info: Dict, group_html: Optional[str]) -> Optional[Dict]:
+        """Queue the content of a fetched entry group page"""
+        group = group_info['group']
+        group_url = group_info['url']
+        
+        if not group_html:
+            logger.error(f"Failed to retrieve group page: {group_url}")
+            return None
+        
+        # Parse the entry content
+        content = self.parse_entry_content(group_html)
+        
+        entry = {
+            'letter': letter,
+            'group': group,
+            'url': group_url,
+            'content': content
+        }
+        
+        # Store in database
+        key = f"{letter}_{group}"
+        self._queue_entry(key, entry)
+        
+        return entry
+    
     def scrape_letter(self, letter_info: Dict, limit_groups: int = None) -> List[Dict]:
         """Scrape all entry groups for a letter"""
+        async def scrape():
+            sem = asyncio.Semaphore(CONCURRENCY)
+            async with self._async_client() as client:
+                html = await self._afetch(client, letter_info['url'], sem)
+                return await self._ascrape_letter(client, sem, letter_info, html, limit_groups)
+        
+        return asyncio.run(scrape())
+    
+    async def _ascrape_letter(self, client: httpx.AsyncClient, sem: asyncio.Semaphore, letter_info: Dict,
+                              html: Optional[str], limit_groups: int = None) -> List[Dict]:
+        """Scrape a letter from its already fetched page; groups are fetched concurrently"""
         letter = letter_info['letter']
         url = letter_info['url']
         
         logger.info(f"Scraping letter: {letter}")
-        html = self._make_request(url)
-        
         if not html:
             logger.error(f"Failed to retrieve letter page: {url}")
             return []
         
-        # Log some debug info about the HTML
-        soup = BeautifulSoup(html, 'lxml')
-        title = soup.title.string if soup.title else "No title"
-        logger.debug(f"Page title: {title}")
-        
-        # Check if we got the expected content
-        text_div = soup.select_one('div.text')
-        if text_div:
-            logger.debug(f"Found text div with content: {text_div.get_text()[:100]}...")
-            
-            # Store the entire letter page as one entry since it contains the actual definitions
-            content = {
-                'text': text_div.get_text().strip(),
-                'html': str(text_div)
-            }
-            
-            entry = {
-                'letter': letter,
-                'group': f"{letter} - Complete Letter Entries",
-                'url': url,
-                'content': content
-            }
-            
-            # Store in database
-            key = f"{letter}_complete"
-            self.db.store_entry(key, entry)
-            
+        tree = LexborHTMLParser(html)
+        entry = self._letter_page_entry(letter_info, tree)
+        if entry:
             return [entry]
-        else:
-            logger.warning("No div.text found on the page")
-            
+        
         # Parse entry groups - this is for fallback only
-        groups = self.parse_entry_groups(html)
+        groups = self.parse_entry_groups(tree)
         logger.info(f"Found {len(groups)} entry groups for letter {letter}")
         
         # If we didn't find direct content or groups, try a different URL format
         if not groups:
             logger.info("Trying different URL format for this letter")
-            # The Perseus site sometimes uses this format: entry for a specific letter
-            alt_url = f"https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057:entry={letter.lower()}"
-            logger.debug(f"Trying alternate URL: {alt_url}")
-            
-            alt_html = self._make_request(alt_url)
-            if alt_html:
-                alt_soup = BeautifulSoup(alt_html, 'lxml')
-                alt_text_div = alt_soup.select_one('div.text')
-                
-                if alt_text_div:
-                    logger.info(f"Found content with alternate URL")
-                    content = {
-                        'text': alt_text_div.get_text().strip(),
-                        'html': str(alt_text_div)
-                    }
-                    
-                    entry = {
-                        'letter': letter,
-                        'group': f"{letter} - Alternate Format",
-                        'url': alt_url,
-                        'content': content
-                    }
-                    
-                    # Store in database
-                    key = f"{letter}_alternate"
-                    self.db.store_entry(key, entry)
-                    
-                    return [entry]
+            alt_url = self._alternate_url(letter)
+            entry = self._alternate_entry(letter, alt_url, await self._afetch(client, alt_url, sem))
+            if entry:
+                return [entry]
         
         if limit_groups:
             groups = groups[:limit_groups]
         
-        entries = []
         for group_info in groups:
-            group = group_info['group']
-            group_url = group_info['url']
-            
-            logger.info(f"Scraping group: {group}")
-            group_html = self._make_request(group_url)
-            
-            if not group_html:
-                logger.error(f"Failed to retrieve group page: {group_url}")
-                continue
-            
-            # Parse the entry content
-            content = self.parse_entry_content(group_html)
-            
-            entry = {
-                'letter': letter,
-                'group': group,
-                'url': group_url,
-                'content': content
-            }
-            
-            # Store in database
-            key = f"{letter}_{group}"
-            self.db.store_entry(key, entry)
-            
-            entries.append(entry)
+            logger.info(f"Scraping group: {group_info['group']}")
+        group_htmls = await asyncio.gather(*(
+            self._afetch(client, group_info['url'], sem) for group_info in groups
+        ))
+        
+        entries = []
+        for group_info, group_html in zip(groups, group_htmls):
+            entry = self._group_entry(letter, group_info, group_html)
+            if entry:
+                entries.append(entry)
         
         return entries
     
-    def run(self, limit_letters: int = None, limit_groups: int = None):
+    def run(self, limit_letters: int = None, limit_groups: int = None, concurrency: int = CONCURRENCY):
         """Run the scraper for LSJ entries"""
+        return asyncio.run(self.arun(limit_letters, limit_groups, concurrency))
+
+    async def arun(self, limit_letters: int = None, limit_groups: int = None, concurrency: int = CONCURRENCY):
+        """Fetch the letter pages and their group pages concurrently, then parse and store them in order"""
         # Get all Greek letters
         greek_letters = self.get_greek_letters()
         logger.info(f"Found {len(greek_letters)} Greek letters")
@@ -262,21 +287,26 @@ class LSJEntryScraper:
         if limit_letters:
             greek_letters = greek_letters[:limit_letters]
         
+        sem = asyncio.Semaphore(concurrency)
         all_entries = []
-        for letter_info in greek_letters:
-            entries = self.scrape_letter(letter_info, limit_groups)
-            all_entries.extend(entries)
+        async with self._async_client() as client:
+            htmls = await asyncio.gather(*(
+                self._afetch(client, letter_info['url'], sem) for letter_info in greek_letters
+            ))
+            
+            for letter_info, html in zip(greek_letters, htmls):
+                entries = await self._ascrape_letter(client, sem, letter_info, html, limit_groups)
+                all_entries.extend(entries)
         
+        self._flush()
         return all_entries
     
     def export_results(self, output_path: str = "lsj_entries_export.json"):
         """Export the scraped entries to a JSON file"""
-        entries = self.db.get_all_entries()
+        # Streamed row by row from the database rather than loaded into memory
+        count = self.db.export_to_json(output_path)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(entries, f, ensure_ascii=False, indent=2)
-            
-        logger.info(f"Exported {len(entries)} entries to {output_path}")
+        logger.info(f"Exported {count} entries to {output_path}")
 
 def main():
     """Main entry point"""
@@ -293,6 +323,10 @@ def main():
                         help="Output file path")
     parser.add_argument("--force", action="store_true",
                         help="Force running without limits")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Refetch every page instead of reusing pages cached by earlier runs")
+    parser.add_argument("--text-only", action="store_true",
+                        help="Store only entry text, skipping the HTML serialization")
     
     args = parser.parse_args()
     
@@ -301,9 +335,9 @@ def main():
         logger.info("Use --force to run without limits or specify limits with --limit-letters and --limit-groups.")
         return
     
-    scraper = LSJEntryScraper(delay=args.delay)
-    scraper.run(args.limit_letters, args.limit_groups)
-    scraper.export_results(args.output)
+    with LSJEntryScraper(delay=args.delay, keep_html=not args.text_only, refresh=args.refresh) as scraper:
+        scraper.run(args.limit_letters, args.limit_groups)
+        scraper.export_results(args.output)
     
     logger.info(f"Scraping complete. Results exported to {args.output}")
 
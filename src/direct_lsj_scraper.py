@@ -1,19 +1,19 @@
 import asyncio
-import json
 import logging
 import os
-import time
+import re
 from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
-from urllib.parse import quote, urljoin, urlparse, parse_qs
+from urllib.parse import quote, urlparse, parse_qs
 
-import requests
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 from database import Database
+from fetcher import PerseusFetcher, perseus_url
 
 # Configuration
 REQUEST_DELAY = 1.2  # Seconds between requests
-MAX_RETRIES = 3  # Maximum retry attempts for failed requests
+CONCURRENCY = 8  # Maximum concurrent requests
+BATCH_SIZE = 1000  # Entries buffered per database transaction
 
 # Set up logging
 logging.basicConfig(
@@ -23,78 +23,60 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Base URLs
-BASE_URL = "https://www.perseus.tufts.edu/hopper"
 LSJ_URL = "https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057"
 
-class DirectLSJScraper:
-    def __init__(self, delay: float = REQUEST_DELAY):
-        self.delay = delay
-        self.last_request_time = 0
-        self.db = Database("lsj_direct.sqlite")
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36',
-        })
-    
-    def _wait_for_delay(self):
-        """Ensure we respect the delay between requests."""
-        now = time.time()
-        time_since_last = now - self.last_request_time
-        if time_since_last < self.delay:
-            time.sleep(self.delay - time_since_last)
-        self.last_request_time = time.time()
+# CSS selectors shared by the parse paths
+TEXT_SELECTOR = 'div.text'
+TEXT_CLASS_SELECTOR = '.text'
+ENTRY_LIST_SELECTOR = 'div.entry_list'
+ENTRY_GROUP_SELECTOR = 'div.entry_group'
+BROWSE_BAR_SELECTOR = '#browse_bar'
+LINK_SELECTOR = 'a'
+# Lexbor returns an element once per matching selector in a group, so the two halves must not overlap
+GROUP_LINK_SELECTOR = 'a[href*="text"], a[href*="entry"]:not([href*="text"])'
 
-    def _make_request(self, url: str) -> Optional[str]:
-        """Make HTTP request with retry logic"""
-        for attempt in range(MAX_RETRIES):
-            try:
-                self._wait_for_delay()
-                response = self.session.get(url, timeout=30)
-                response.raise_for_status()
-                return response.text
-            except Exception as e:
-                logger.error(f"Request error on attempt {attempt+1}/{MAX_RETRIES}: {url} - {str(e)}")
-                if attempt == MAX_RETRIES - 1:
-                    return None
-                time.sleep(self.delay * (attempt + 1))
-        return None
+# The alphabet is fixed, so letter pages are addressed directly rather than discovered
+LETTER_URL_PREFIX = "https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057:alphabetic%20letter="
+GREEK_LETTER_CODES = {
+    'Α': '*a', 'Β': '*b', 'Γ': '*g', 'Δ': '*d', 'Ε': '*e',
+    'Ζ': '*z', 'Η': '*h', 'Θ': '*q', 'Ι': '*i', 'Κ': '*k',
+    'Λ': '*l', 'Μ': '*m', 'Ν': '*n', 'Ξ': '*c', 'Ο': '*o',
+    'Π': '*p', 'Ρ': '*r', 'Σ': '*s', 'Τ': '*t', 'Υ': '*u',
+    'Φ': '*f', 'Χ': '*x', 'Ψ': '*y', 'Ω': '*w'
+}
+# Built once at import; the dicts are shared, so callers treat them as read-only
+_GREEK_LETTERS: Tuple[Dict[str, str], ...] = tuple(
+    {'letter': letter, 'url': f"{LETTER_URL_PREFIX}{code}"}
+    for letter, code in GREEK_LETTER_CODES.items()
+)
 
-    def scrape_greek_letters(self) -> List[Dict]:
-        """Extract Greek letter links from the main LSJ page"""
-        html = self._make_request(LSJ_URL)
-        if not html:
-            logger.error("Failed to retrieve main LSJ page")
-            return []
-        
-        # Try to extract Greek letters using our specialized method
-        greek_letters = self.extract_greek_letters_from_html(html)
-        
-        # If we found letters, return them
-        if greek_letters:
-            return greek_letters
+# Fallback patterns for picking letter links out of the LSJ index page
+_GREEK_UPPER = frozenset('ΑΒΓΔΕΖΗΘΙΚΛΜΝΞΟΠΡΣΤΥΦΧΨΩ')
+_GREEK_LINK_RE = re.compile(r'<a href="([^"]+)[^>]*>([ΑΒΓΔΕΖΗΘΙΚΛΜΝΞΟΠΡΣΤΥΦΧΨΩ])</a>')
+
+class DirectLSJScraper(PerseusFetcher):
+    def __init__(self, delay: float = REQUEST_DELAY, keep_html: bool = True, refresh: bool = False):
+        super().__init__(Database("lsj_direct.sqlite"), delay, BATCH_SIZE, refresh)
+        # Serializing the content subtree back to HTML is skipped when only text is wanted
+        self.keep_html = keep_html
+
+    def scrape_greek_letters(self, discover: bool = False) -> List[Dict]:
+        """Return the Greek letter pages, optionally discovering them from the main LSJ page"""
+        if discover:
+            html = self._make_request(LSJ_URL)
+            if not html:
+                logger.error("Failed to retrieve main LSJ page")
+                return []
             
-        # Fallback to the hardcoded approach
-        logger.info("Using hardcoded approach for Greek letters")
-        base_url = "https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057:alphabetic%20letter="
-        
-        # Map of Greek letters to URL encoding
-        greek_letter_map = {
-            'Α': '*a', 'Β': '*b', 'Γ': '*g', 'Δ': '*d', 'Ε': '*e',
-            'Ζ': '*z', 'Η': '*h', 'Θ': '*q', 'Ι': '*i', 'Κ': '*k',
-            'Λ': '*l', 'Μ': '*m', 'Ν': '*n', 'Ξ': '*c', 'Ο': '*o',
-            'Π': '*p', 'Ρ': '*r', 'Σ': '*s', 'Τ': '*t', 'Υ': '*u',
-            'Φ': '*f', 'Χ': '*x', 'Ψ': '*y', 'Ω': '*w'
-        }
-        
-        greek_letters = []
-        for greek_letter, url_code in greek_letter_map.items():
-            greek_letters.append({
-                'letter': greek_letter,
-                'url': f"{base_url}{url_code}"
-            })
+            # Try to extract Greek letters using our specialized method
+            greek_letters = self.extract_greek_letters_from_html(html)
             
-        logger.info(f"Using {len(greek_letters)} hardcoded Greek letter URLs")
-        return greek_letters
+            # If we found letters, return them
+            if greek_letters:
+                return greek_letters
+        
+        logger.info(f"Using {len(_GREEK_LETTERS)} hardcoded Greek letter URLs")
+        return list(_GREEK_LETTERS)
 
     def scrape_entry_groups(self, letter_url: str) -> List[Dict]:
         """Scrape all entry groups for a given letter"""
@@ -103,19 +85,24 @@ class DirectLSJScraper:
             logger.error(f"Failed to retrieve letter page: {letter_url}")
             return []
         
-        soup = BeautifulSoup(html, 'lxml')
+        return self.parse_entry_groups(LexborHTMLParser(html))
+
+    def parse_entry_groups(self, tree: LexborHTMLParser) -> List[Dict]:
+        """Parse the entry groups out of an already parsed letter page"""
         groups = []
         
         # The letter page structure is different - check if there's a list of entry groups
-        entry_list = soup.select_one('div.entry_list')
+        entry_list = tree.css_first(ENTRY_LIST_SELECTOR)
         if entry_list:
-            for link in entry_list.find_all('a'):
-                href = link.get('href')
-                group_text = link.get_text().strip()
+            for link in entry_list.css(LINK_SELECTOR):
+                href = link.attrs.get('href')
+                if not href:
+                    continue
+                group_text = link.text().strip()
                 
-                if href and group_text:
+                if group_text:
                     # Make sure the href is properly joined with the base URL
-                    full_url = href if href.startswith('http') else urljoin(BASE_URL, href)
+                    full_url = perseus_url(href)
                     groups.append({
                         'group': group_text,
                         'url': full_url
@@ -123,15 +110,17 @@ class DirectLSJScraper:
             return groups
         
         # If no entry list was found, look for the entry group links
-        entry_group_section = soup.select_one('div.entry_group')
+        entry_group_section = tree.css_first(ENTRY_GROUP_SELECTOR)
         if entry_group_section:
-            for link in entry_group_section.find_all('a'):
-                href = link.get('href')
-                group_text = link.get_text().strip()
+            for link in entry_group_section.css(LINK_SELECTOR):
+                href = link.attrs.get('href')
+                if not href:
+                    continue
+                group_text = link.text().strip()
                 
-                if href and group_text:
+                if group_text:
                     # Make sure the href is properly joined with the base URL
-                    full_url = href if href.startswith('http') else urljoin(BASE_URL, href)
+                    full_url = perseus_url(href)
                     groups.append({
                         'group': group_text,
                         'url': full_url
@@ -139,33 +128,34 @@ class DirectLSJScraper:
         else:
             # If we still haven't found anything, look for any relevant links
             # in the main content area
-            content_area = soup.select_one('div.text')
+            content_area = tree.css_first(TEXT_SELECTOR)
             if content_area:
-                for link in content_area.find_all('a'):
-                    href = link.get('href')
-                    group_text = link.get_text().strip()
+                for link in content_area.css(LINK_SELECTOR):
+                    href = link.attrs.get('href')
+                    if not href:
+                        continue
+                    group_text = link.text().strip()
                     
                     # Filter out navigational links and focus on entry links
-                    if (href and group_text and 
+                    if (group_text and 
                         not href.startswith('#') and 
                         not 'browse' in href.lower() and 
                         len(group_text.strip()) > 1):
-                        full_url = href if href.startswith('http') else urljoin(BASE_URL, href)
+                        full_url = perseus_url(href)
                         groups.append({
                             'group': group_text,
                             'url': full_url
                         })
             else:
                 # Last resort: try to find links that look like entry groups
-                for link in soup.find_all('a'):
-                    href = link.get('href')
-                    group_text = link.get_text().strip()
+                for link in tree.css(GROUP_LINK_SELECTOR):
+                    href = link.attrs['href']
+                    group_text = link.text().strip()
                     
-                    if (href and group_text and 
+                    if (group_text and 
                         not href.startswith('#') and 
-                        ('text' in href or 'entry' in href) and 
-                        len(group_text.strip()) > 1):
-                        full_url = href if href.startswith('http') else urljoin(BASE_URL, href)
+                        len(group_text) > 1):
+                        full_url = perseus_url(href)
                         groups.append({
                             'group': group_text,
                             'url': full_url
@@ -180,16 +170,20 @@ class DirectLSJScraper:
             logger.error(f"Failed to retrieve page: {url}")
             return {'url': url, 'html': '', 'text': ''}
         
-        soup = BeautifulSoup(html, 'lxml')
+        return self.parse_page_content(url, html)
+
+    def parse_page_content(self, url: str, html: str) -> Dict:
+        """Parse the full HTML and text content out of an entry page"""
+        tree = LexborHTMLParser(html)
         
         # Find the main text content
-        text_element = soup.select_one('.text')
+        text_element = tree.css_first(TEXT_CLASS_SELECTOR)
         
         if text_element:
             return {
                 'url': url,
-                'html': str(text_element),
-                'text': text_element.get_text().strip()
+                'html': text_element.html if self.keep_html else '',
+                'text': text_element.text().strip()
             }
         
         return {
@@ -198,8 +192,12 @@ class DirectLSJScraper:
             'text': ''
         }
 
-    def run_full_crawl(self, limit_letters: int = None, limit_groups: int = None):
+    def run_full_crawl(self, limit_letters: int = None, limit_groups: int = None, concurrency: int = CONCURRENCY):
         """Run a full crawl of the LSJ lexicon"""
+        asyncio.run(self.arun_full_crawl(limit_letters, limit_groups, concurrency))
+
+    async def arun_full_crawl(self, limit_letters: int = None, limit_groups: int = None, concurrency: int = CONCURRENCY):
+        """Crawl with concurrent fetches; parsing and storage stay sequential"""
         # Get all Greek letters
         letters = self.scrape_greek_letters()
         logger.info(f"Found {len(letters)} Greek letters")
@@ -207,51 +205,68 @@ class DirectLSJScraper:
         if limit_letters:
             letters = letters[:limit_letters]
         
-        for letter_info in letters:
-            letter = letter_info['letter']
-            letter_url = letter_info['url']
-            
-            logger.info(f"Processing letter: {letter}")
+        sem = asyncio.Semaphore(concurrency)
+        async with self._async_client() as client:
+            letter_htmls = await asyncio.gather(*(
+                self._afetch(client, letter_info['url'], sem) for letter_info in letters
+            ))
             
-            # Get all entry groups for this letter
-            groups = self.scrape_entry_groups(letter_url)
-            logger.info(f"Found {len(groups)} entry groups for letter {letter}")
-            
-            if limit_groups:
-                groups = groups[:limit_groups]
-            
-            for group_info in groups:
-                group = group_info['group']
-                group_url = group_info['url']
+            for letter_info, letter_html in zip(letters, letter_htmls):
+                letter = letter_info['letter']
+                
+                logger.info(f"Processing letter: {letter}")
                 
-                logger.info(f"Processing group: {group}")
+                if not letter_html:
+                    logger.error(f"Failed to retrieve letter page: {letter_info['url']}")
+                    continue
                 
-                # Store the full page content
-                page_content = self.extract_page_content(group_url)
+                # Get all entry groups for this letter
+                groups = self.parse_entry_groups(LexborHTMLParser(letter_html))
+                logger.info(f"Found {len(groups)} entry groups for letter {letter}")
                 
-                # Use a safe key for database storage
-                parsed_url = urlparse(group_url)
-                query_params = parse_qs(parsed_url.query)
-                group_key = f"{letter}_{group}"
+                if limit_groups:
+                    groups = groups[:limit_groups]
                 
-                if 'doc' in query_params:
-                    group_key = query_params['doc'][0]
+                group_htmls = await asyncio.gather(*(
+                    self._afetch(client, group_info['url'], sem) for group_info in groups
+                ))
+                
+                for group_info, group_html in zip(groups, group_htmls):
+                    group = group_info['group']
+                    group_url = group_info['url']
                     
-                self.db.store_entry(group_key, {
-                    'letter': letter,
-                    'group': group,
-                    'url': group_url,
-                    'content': page_content
-                })
+                    logger.info(f"Processing group: {group}")
+                    
+                    # Store the full page content
+                    if group_html:
+                        page_content = self.parse_page_content(group_url, group_html)
+                    else:
+                        logger.error(f"Failed to retrieve page: {group_url}")
+                        page_content = {'url': group_url, 'html': '', 'text': ''}
+                    
+                    # Use a safe key for database storage
+                    parsed_url = urlparse(group_url)
+                    query_params = parse_qs(parsed_url.query)
+                    group_key = f"{letter}_{group}"
+                    
+                    if 'doc' in query_params:
+                        group_key = query_params['doc'][0]
+                        
+                    self._queue_entry(group_key, {
+                        'letter': letter,
+                        'group': group,
+                        'url': group_url,
+                        'content': page_content
+                    })
+        
+        self._flush()
     
     def export_results(self, output_path: str = "lsj_direct_export.json"):
         """Export the scraped data to a JSON file"""
-        entries = self.db.get_all_entries()
+        # Streamed row by row from the database rather than loaded into memory
+        count = self.db.export_to_json(output_path)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(entries, f, ensure_ascii=False, indent=2)
-            
-        logger.info(f"Exported {len(entries)} entries to {output_path}")
+        logger.info(f"Exported {count} entries to {output_path}")
 
     def extract_greek_letters_from_html(self, html: str) -> List[Dict]:
         """Extract Greek letters directly from the HTML structure of the LSJ lexicon page.
@@ -263,88 +278,70 @@ class DirectLSJScraper:
         
         # Look for the section containing alphabetic letters
         # The letters are typically in a section with IDs or classes related to 'alphabetic_letter'
-        soup = BeautifulSoup(html, 'lxml')
+        tree = LexborHTMLParser(html)
         
         # Try different methods to find the letter sections
         
         # 1. Look for browse bar
         logger.debug("Trying to find browse bar...")
-        browse_bar = soup.select_one('#browse_bar')
+        browse_bar = tree.css_first(BROWSE_BAR_SELECTOR)
         if browse_bar:
             logger.debug("Found browse bar, looking for links inside")
             letter_section = None
             
             # The letters might be inside a specific child element
-            for child in browse_bar.children:
-                if hasattr(child, 'get_text'):
-                    text = child.get_text().strip()
-                    # Check if this element contains Greek letters
-                    if any(greek_char in text for greek_char in 'ΑΒΓΔΕΖΗΘΙΚΛΜΝΞΟΠΡΣΤΥΦΧΨΩ'):
-                        logger.debug(f"Found potential letter section: {text[:30]}...")
-                        letter_section = child
-                        break
+            # iter() yields element children only, skipping bare text nodes
+            for child in browse_bar.iter():
+                text = child.text().strip()
+                # Check if this element contains Greek letters
+                if not _GREEK_UPPER.isdisjoint(text):
+                    logger.debug("Found potential letter section: %s...", text[:30])
+                    letter_section = child
+                    break
             
             if letter_section:
-                for link in letter_section.find_all('a'):
-                    href = link.get('href')
-                    text = link.get_text().strip()
-                    if href and len(text) <= 2:  # Some Greek letters may have diacritics
+                for link in letter_section.css(LINK_SELECTOR):
+                    href = link.attrs.get('href')
+                    if not href:
+                        continue
+                    text = link.text().strip()
+                    if len(text) <= 2:  # Some Greek letters may have diacritics
                         greek_letters.append({
                             'letter': text,
-                            'url': urljoin(BASE_URL, href)
+                            'url': perseus_url(href)
                         })
         
         # 2. Manually search for links with Greek letters
         if not greek_letters:
             logger.debug("Manual search for Greek letter links")
-            greek_alpha_range = set('ΑΒΓΔΕΖΗΘΙΚΛΜΝΞΟΠΡΣΤΥΦΧΨΩ')
-            
-            for link in soup.find_all('a'):
-                href = link.get('href')
-                text = link.get_text().strip()
+            for link in tree.css(LINK_SELECTOR):
+                href = link.attrs.get('href')
+                if not href:
+                    continue
+                text = link.text().strip()
                 
                 # Check if this is likely a Greek letter link
-                if href and text and len(text) == 1 and text in greek_alpha_range:
+                if len(text) == 1 and text in _GREEK_UPPER:
                     greek_letters.append({
                         'letter': text,
-                        'url': urljoin(BASE_URL, href)
+                        'url': perseus_url(href)
                     })
         
         # 3. Try direct regex pattern matching on the HTML
         if not greek_letters:
             logger.debug("Using regex pattern matching")
-            import re
             
             # Look for links with the pattern typically used for letter navigation
-            alpha_letter_pattern = r'<a href="([^"]+)[^>]*>([ΑΒΓΔΕΖΗΘΙΚΛΜΝΞΟΠΡΣΤΥΦΧΨΩ])</a>'
-            matches = re.findall(alpha_letter_pattern, html)
-            
-            for href, letter in matches:
+            for match in _GREEK_LINK_RE.finditer(html):
                 greek_letters.append({
-                    'letter': letter,
-                    'url': urljoin(BASE_URL, href)
+                    'letter': match.group(2),
+                    'url': perseus_url(match.group(1))
                 })
         
         # If we still don't have any letters, try hardcoding known URL patterns
         if not greek_letters:
             logger.debug("Using hardcoded pattern for Greek letter URLs")
-            greek_letters = []
-            base_url = "https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057:alphabetic%20letter="
-            
-            # Map of Greek letters to URL encoding (if needed)
-            greek_letter_map = {
-                'Α': '*a', 'Β': '*b', 'Γ': '*g', 'Δ': '*d', 'Ε': '*e',
-                'Ζ': '*z', 'Η': '*h', 'Θ': '*q', 'Ι': '*i', 'Κ': '*k',
-                'Λ': '*l', 'Μ': '*m', 'Ν': '*n', 'Ξ': '*c', 'Ο': '*o',
-                'Π': '*p', 'Ρ': '*r', 'Σ': '*s', 'Τ': '*t', 'Υ': '*u',
-                'Φ': '*f', 'Χ': '*x', 'Ψ': '*y', 'Ω': '*w'
-            }
-            
-            for greek_letter, url_code in greek_letter_map.items():
-                greek_letters.append({
-                    'letter': greek_letter,
-                    'url': f"{base_url}{url_code}"
-                })
+            greek_letters = list(_GREEK_LETTERS)
         
         logger.info(f"Extracted {len(greek_letters)} Greek letters")
         return greek_letters
@@ -362,6 +359,10 @@ def main():
                         help="Output file path")
     parser.add_argument("--force", action="store_true",
                         help="Force running without limits")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Refetch every page instead of reusing pages cached by earlier runs")
+    parser.add_argument("--text-only", action="store_true",
+                        help="Store only entry text, skipping the HTML serialization")
     
     args = parser.parse_args()
     
@@ -370,9 +371,9 @@ def main():
         logger.info("Use --force to run without limits or specify limits with --limit-letters and --limit-groups.")
         return
     
-    scraper = DirectLSJScraper()
-    scraper.run_full_crawl(args.limit_letters, args.limit_groups)
-    scraper.export_results(args.output)
+    with DirectLSJScraper(keep_html=not args.text_only, refresh=args.refresh) as scraper:
+        scraper.run_full_crawl(args.limit_letters, args.limit_groups)
+        scraper.export_results(args.output)
     
     logger.info(f"Scraping complete. Results exported to {args.output}")
 
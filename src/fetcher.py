@@ -0,0 +1,226 @@
+import asyncio
+import functools
+import logging
+import time
+from typing import Any, Coroutine, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Configuration shared by every scraper that fetches pages over plain HTTP
+MAX_RETRIES = 3  # Maximum retry attempts for failed requests
+MAX_DELAY = 30.0  # Ceiling for the delay after the server pushes back
+DELAY_STEP = 0.1  # Seconds taken off the delay after each successful request
+THROTTLE_STATUSES = (429, 503)  # Responses that mean the server wants us to slow down
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
+
+# Browser settings shared by the scrapers that render pages with Playwright
+BLOCKED_RESOURCE_TYPES = frozenset({'image', 'font', 'stylesheet', 'media'})  # Never read by the scrapers
+# Chromium flags for an unattended headless crawl
+BROWSER_ARGS = [
+    '--disable-gpu',
+    '--disable-dev-shm-usage',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-sync',
+]
+
+# Perseus links are relative to the hopper application, not to the site root
+SITE_ROOT = "https://www.perseus.tufts.edu"
+PERSEUS_BASE_URL = "https://www.perseus.tufts.edu/hopper"
+
+# Navigation links repeat on every page, so each href is resolved once
+@functools.lru_cache(maxsize=8192)
+def perseus_url(href: str) -> str:
+    """Resolve a link on a Perseus page, skipping urljoin for the common href shapes"""
+    if href[:4] == 'http':
+        return href
+    if href[:1] == '/' and href[:2] != '//':
+        return SITE_ROOT + href
+    if '..' in href or href[:1] in '#?./':
+        return urljoin(PERSEUS_BASE_URL + '/', href)
+    return PERSEUS_BASE_URL + '/' + href
+
+def retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def store_batch(db, rows: List[Tuple[str, Dict]]) -> List[str]:
+    """Store entries in one transaction, falling back to one write per entry if the batch fails.
+    Returns the keys of the entries that could not be stored.
+    """
+    if db.store_entries(rows):
+        return []
+    # One bad row or a busy timeout shouldn't cost the whole batch
+    logger.warning(f"Batch of {len(rows)} entries failed, storing them one at a time")
+    lost = [key for key, entry in rows if not db.store_entry(key, entry)]
+    if lost:
+        logger.error(f"Lost {len(lost)} entries: {', '.join(lost)}")
+    return lost
+
+def run_async(main: Coroutine) -> Any:
+    """Run a coroutine to completion on uvloop where it is installed, the default event loop otherwise"""
+    # uvloop cuts event loop overhead for the many concurrent page tasks; it isn't available on Windows
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(main)
+    return uvloop.run(main)
+
+async def block_heavy_resources(route):
+    """Abort requests for resources the scrapers never read"""
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+class RequestPacer:
+    """Start requests at least `delay` seconds apart, sync or async, across concurrent callers"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        # The delay adapts to throttling but never drops below the configured value
+        self.base_delay = delay
+        # Start time reserved for the next request
+        self._next_slot = 0.0
+
+    def reserve(self) -> float:
+        """Reserve the next request slot and return how many seconds to wait for it"""
+        # No lock needed: the reservation happens without yielding to the event loop
+        now = time.monotonic()
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + self.delay
+        return slot - now
+
+    def hold(self, seconds: float):
+        """Push back every caller's next request by at least `seconds`"""
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+    def backoff(self, response: httpx.Response) -> float:
+        """Double the delay after a throttling response and return how long to wait before retrying"""
+        self.delay = min(self.delay * 2, MAX_DELAY)
+        wait = retry_after(response.headers.get('Retry-After'))
+        logger.warning(f"Throttled with {response.status_code}, delay now {self.delay:.1f}s: {response.url}")
+        return self.delay if wait is None else wait
+
+    def recover(self):
+        """Ease the delay back towards the configured value after a success"""
+        if self.delay > self.base_delay:
+            self.delay = max(self.base_delay, self.delay - DELAY_STEP)
+
+class PerseusFetcher:
+    """Paced, retrying Perseus page fetches cached in the database, with entries written in batches"""
+
+    def __init__(self, db, delay: float, batch_size: int, refresh: bool = False):
+        self.db = db
+        # Cached pages never expire on their own; a refresh run refetches them and overwrites the cache
+        self.refresh = refresh
+        self.pacer = RequestPacer(delay)
+        self._pending: List[Tuple[str, Dict]] = []
+        self._batch_size = batch_size
+        # One keep-alive HTTP/2 pool, so every Perseus request reuses the same TLS connection
+        self.client = httpx.Client(
+            http2=True,
+            headers={'User-Agent': USER_AGENT},
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60.0),
+            timeout=30.0,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Write out buffered entries and release the HTTP connection pool and the database"""
+        self._flush()
+        self.client.close()
+        self.db.close()
+
+    def _make_request(self, url: str) -> Optional[str]:
+        """Make HTTP request with retry logic, serving pages fetched on earlier runs from the database"""
+        if not self.refresh:
+            cached = self.db.get_fetched(url)
+            if cached is not None:
+                return cached
+
+        for attempt in range(MAX_RETRIES):
+            try:
+                time.sleep(self.pacer.reserve())
+                response = self.client.get(url)
+                if response.status_code in THROTTLE_STATUSES and attempt < MAX_RETRIES - 1:
+                    time.sleep(self.pacer.backoff(response))
+                    continue
+                response.raise_for_status()
+                self.pacer.recover()
+                logger.debug("%s %s: %s", response.http_version, response.status_code, url)
+                self.db.mark_fetched(url, response.text)
+                return response.text
+            except Exception as e:
+                logger.error(f"Request error on attempt {attempt+1}/{MAX_RETRIES}: {url} - {str(e)}")
+                if attempt == MAX_RETRIES - 1:
+                    return None
+                time.sleep(self.pacer.delay * (attempt + 1))
+        return None
+
+    async def _afetch(self, client: httpx.AsyncClient, url: str, sem: asyncio.Semaphore) -> Optional[str]:
+        """Async counterpart of _make_request, bounded by the semaphore"""
+        # Cache reads and writes decompress or compress a whole page, so they run off the event loop
+        if not self.refresh:
+            cached = await asyncio.to_thread(self.db.get_fetched, url)
+            if cached is not None:
+                return cached
+
+        async with sem:
+            for attempt in range(MAX_RETRIES):
+                try:
+                    await asyncio.sleep(self.pacer.reserve())
+                    response = await client.get(url)
+                    if response.status_code in THROTTLE_STATUSES and attempt < MAX_RETRIES - 1:
+                        await asyncio.sleep(self.pacer.backoff(response))
+                        continue
+                    response.raise_for_status()
+                    self.pacer.recover()
+                    await asyncio.to_thread(self.db.mark_fetched, url, response.text)
+                    return response.text
+                except Exception as e:
+                    logger.error(f"Request error on attempt {attempt+1}/{MAX_RETRIES}: {url} - {str(e)}")
+                    if attempt == MAX_RETRIES - 1:
+                        return None
+                    await asyncio.sleep(self.pacer.delay * (attempt + 1))
+        return None
+
+    def _async_client(self, max_connections: int = 20) -> httpx.AsyncClient:
+        """Build a pooled HTTP/2 client with the sync client's headers"""
+        return httpx.AsyncClient(
+            http2=True,
+            headers=self.client.headers,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=30,
+        )
+
+    def _queue_entry(self, key: str, entry: Dict):
+        """Buffer an entry, writing the buffer out once it reaches the batch size"""
+        self._pending.append((key, entry))
+        if len(self._pending) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        """Write buffered entries in a single transaction, entry by entry if that fails"""
+        if self._pending:
+            store_batch(self.db, self._pending)
+            self._pending = []
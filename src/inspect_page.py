@@ -1,7 +1,13 @@
+import argparse
 import asyncio
-from playwright.async_api import async_playwright
 import json
 
+import httpx
+
+# JSON endpoint the Logeion front end loads entries from; the browser is only needed to rediscover it
+LOGEION_API_URL = "https://anastrophe.uchicago.edu/logeion-api/detail"
+LOGEION_PAGE_URL = "https://logeion.uchicago.edu/"
+
 async def log_request(request):
     if 'api' in request.url or 'logeion' in request.url:
         print(f"\nRequest: {request.method} {request.url}")
@@ -15,25 +21,47 @@ async def log_response(response):
         except:
             print("Could not get response body")
 
-async def main():
+def fetch_api(word: str):
+    """Fetch an entry straight from the Logeion API, without a browser"""
+    print("Requesting API...")
+    response = httpx.get(LOGEION_API_URL, params={'w': word, 'type': 'normal'}, timeout=30)
+    print(f"\nResponse: {response.status_code} {response.url}")
+
+    try:
+        data = response.json()
+    except ValueError:
+        print(f"Content preview: {response.text[:200]}")
+        return
+
+    print("\nMain content:")
+    print(json.dumps(data, ensure_ascii=False, indent=2)[:1000])
+
+async def render_page(word: str):
+    """Render the page in Chromium and log the API traffic it generates"""
+    from playwright.async_api import async_playwright
+
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
         context = await browser.new_context()
         page = await context.new_page()
-        
+
         # Monitor network requests
         page.on('request', log_request)
         page.on('response', log_response)
-        
+
         print("Navigating to page...")
-        await page.goto("https://logeion.uchicago.edu/ἀγαθός", wait_until='networkidle')
-        
+        await page.goto(f"{LOGEION_PAGE_URL}{word}", wait_until='networkidle')
+
         print("\nWaiting for content to load...")
-        # Wait for Angular to initialize
-        await page.wait_for_selector('[ng-view]', state='attached', timeout=10000)
-        # Wait a bit longer for content to load
-        await page.wait_for_timeout(5000)
-        
+        # Wait for Angular to render the entry rather than sleeping a fixed time
+        await page.wait_for_function(
+            """() => {
+                const view = document.querySelector('div[ng-view]');
+                return view && view.innerText.trim().length > 50;
+            }""",
+            timeout=15000
+        )
+
         # Try to find any content
         content = await page.evaluate("""
             () => {
@@ -41,11 +69,25 @@ async def main():
                 return mainContent ? mainContent.innerHTML : 'No content found';
             }
         """)
-        
+
         print("\nMain content:")
         print(content[:1000])
-        
+
         await browser.close()
 
+def main():
+    parser = argparse.ArgumentParser(description="Inspect what Logeion returns for a word")
+    parser.add_argument("word", nargs="?", default="ἀγαθός",
+                        help="Word to look up (default: ἀγαθός)")
+    parser.add_argument("--render", action="store_true",
+                        help="Render the page in a headless browser and log its API traffic")
+
+    args = parser.parse_args()
+
+    if args.render:
+        asyncio.run(render_page(args.word))
+    else:
+        fetch_api(args.word)
+
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    main()
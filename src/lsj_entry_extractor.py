@@ -1,16 +1,16 @@
 #!/usr/bin/env python3
+import asyncio
 import os
-import json
-import time
 import logging
 import argparse
-from urllib.parse import quote, urljoin
+from urllib.parse import quote
 from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
 
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from selectolax.lexbor import LexborHTMLParser
 from database import Database
+from fetcher import PerseusFetcher
 
 # Set up logging
 logging.basicConfig(
@@ -21,77 +21,133 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 REQUEST_DELAY = 1.5  # Seconds between requests
-MAX_RETRIES = 3  # Maximum number of retries
+CONCURRENCY = 8  # Maximum number of concurrent requests
+BATCH_SIZE = 100  # Entries buffered per database transaction
 
 # Base URL for the Perseus LSJ dictionary
-BASE_URL = "https://www.perseus.tufts.edu/hopper"
 LSJ_URL = "https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057"
 
-class LSJEntryExtractor:
+# The only part of a Perseus page the extractor reads
+TEXT_SELECTOR = 'div.text'
+
+# Map of Greek letters to URL encoding, built once at import; callers treat the dicts as read-only
+GREEK_LETTER_CODES = {
+    'Α': '*a', 'Β': '*b', 'Γ': '*g', 'Δ': '*d', 'Ε': '*e',
+    'Ζ': '*z', 'Η': '*h', 'Θ': '*q', 'Ι': '*i', 'Κ': '*k',
+    'Λ': '*l', 'Μ': '*m', 'Ν': '*n', 'Ξ': '*c', 'Ο': '*o',
+    'Π': '*p', 'Ρ': '*r', 'Σ': '*s', 'Τ': '*t', 'Υ': '*u',
+    'Φ': '*f', 'Χ': '*x', 'Ψ': '*y', 'Ω': '*w'
+}
+_GREEK_LETTERS: Tuple[Dict[str, str], ...] = tuple(
+    {'letter': letter, 'code': code, 'url': f"{LSJ_URL}:alphabetic%20letter={code}"}
+    for letter, code in GREEK_LETTER_CODES.items()
+)
+
+# Based on the LSJ organization, we generate URLs for common entry patterns
+# For example, for letter Alpha (Α), we might have entries like:
+# - ἄα
+# - ἀάατος
+# - ἀβακέως
+# etc.
+#
+# Using direct entry format:
+# https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057:entry=a)a/atos
+#
+# For Greek letters, the Perseus site uses a transliteration system
+# Where Greek characters are represented in ASCII:
+# α = a, β = b, γ = g, etc.
+# And diacritics have special codes:
+# smooth breathing (᾿) = ), rough breathing (῾) = (,
+# acute accent (´) = /, grave accent (`) = \, circumflex (῀) = =
+#
+# For demonstration, we generate entries for common combinations
+# In a real implementation, we would need a comprehensive list
+#
+# Common Greek words for each letter; add more letters as needed
+COMMON_ENTRIES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    'Α': (
+        # Some common Alpha entries with their transliterated codes
+        ('ἄα', 'a)/a'),                   # a with smooth breathing and acute
+        ('ἀάατος', 'a)a/atos'),           # combination with smooth breathing and acute
+        ('ἀβακέως', 'a)bake/ws'),         # alpha-beta combination
+        ('ἀγαθός', 'a)gaqo/s'),           # alpha-gamma-theta
+        ('ἄγαν', 'a)/gan'),               # alpha-gamma
+        ('ἀδελφός', 'a)delfo/s'),         # alpha-delta-epsilon
+        ('ἀήρ', 'a)h/r'),                 # alpha-eta
+        ('αἰδώς', 'ai)dw/s'),             # alpha-iota
+        ('ἄκρον', 'a)/kron'),             # alpha-kappa
+        ('ἀλήθεια', 'a)lh/qeia'),         # alpha-lambda-eta
+    ),
+    'Β': (
+        ('βαίνω', 'bai/nw'),              # beta-alpha-iota
+        ('βάλλω', 'ba/llw'),              # beta-alpha-lambda
+        ('βασιλεύς', 'basileu/s'),        # beta-alpha-sigma
+        ('βέλος', 'be/los'),              # beta-epsilon
+        ('βίος', 'bi/os'),                # beta-iota
+        ('βλέπω', 'ble/pw'),              # beta-lambda
+        ('βοή', 'boh/'),                  # beta-omicron
+        ('βούλομαι', 'bou/lomai'),        # beta-omicron-upsilon
+        ('βραχύς', 'braxu/s'),            # beta-rho
+        ('βῶλος', 'bw=los'),              # beta-omega
+    ),
+    'Γ': (
+        ('γαῖα', 'gai=a'),                # gamma-alpha-iota
+        ('γάλα', 'ga/la'),                # gamma-alpha
+        ('γέ', 'ge/'),                    # gamma-epsilon
+        ('γῆ', 'gh='),                    # gamma-eta
+        ('γίγνομαι', 'gi/gnomai'),        # gamma-iota-gamma
+        ('γλαυκός', 'glauko/s'),          # gamma-lambda
+        ('γνώμη', 'gnw/mh'),              # gamma-nu
+        ('γόνυ', 'go/nu'),                # gamma-omicron
+        ('γράφω', 'gra/fw'),              # gamma-rho
+        ('γυνή', 'gunh/'),                # gamma-upsilon
+    ),
+}
+
+# Entry info for the common words, with URLs formatted once at import; callers treat the dicts as read-only
+_COMMON_ENTRY_INFOS: Dict[str, Tuple[Dict, ...]] = {
+    letter: tuple(
+        {
+            'id': f"{letter}_{word}",
+            'letter': letter,
+            'word': word,
+            'url': f"{LSJ_URL}:entry={transliteration}",
+            'transliteration': transliteration,
+            'is_letter': False
+        }
+        for word, transliteration in words
+    )
+    for letter, words in COMMON_ENTRIES.items()
+}
+
+class LSJEntryExtractor(PerseusFetcher):
     """Specialized extractor for Greek dictionary entries in the LSJ lexicon using direct URL construction"""
     
-    def __init__(self, db_path: str = "lsj_entries.sqlite", delay: float = REQUEST_DELAY):
-        self.db = Database(db_path)
-        self.delay = delay
-        self.last_request_time = 0
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36',
-        })
-    
-    def _wait_for_delay(self):
-        """Ensure we respect the delay between requests."""
-        now = time.time()
-        time_since_last = now - self.last_request_time
-        if time_since_last < self.delay:
-            time.sleep(self.delay - time_since_last)
-        self.last_request_time = time.time()
-
-    def _make_request(self, url: str) -> Optional[str]:
-        """Make HTTP request with retry logic"""
-        for attempt in range(MAX_RETRIES):
-            try:
-                self._wait_for_delay()
-                response = self.session.get(url, timeout=30)
-                response.raise_for_status()
-                return response.text
-            except Exception as e:
-                logger.error(f"Request error on attempt {attempt+1}/{MAX_RETRIES}: {url} - {str(e)}")
-                if attempt == MAX_RETRIES - 1:
-                    return None
-                time.sleep(self.delay * (attempt + 1))
-        return None
+    def __init__(self, db_path: str = "lsj_entries.sqlite", delay: float = REQUEST_DELAY, refresh: bool = False):
+        super().__init__(Database(db_path), delay, BATCH_SIZE, refresh)
     
     def get_greek_letters_with_codes(self) -> List[Dict]:
         """Get the list of Greek alphabet letters with their URL codes"""
-        # Map of Greek letters to URL encoding
-        greek_letter_map = {
-            'Α': '*a', 'Β': '*b', 'Γ': '*g', 'Δ': '*d', 'Ε': '*e',
-            'Ζ': '*z', 'Η': '*h', 'Θ': '*q', 'Ι': '*i', 'Κ': '*k',
-            'Λ': '*l', 'Μ': '*m', 'Ν': '*n', 'Ξ': '*c', 'Ο': '*o',
-            'Π': '*p', 'Ρ': '*r', 'Σ': '*s', 'Τ': '*t', 'Υ': '*u',
-            'Φ': '*f', 'Χ': '*x', 'Ψ': '*y', 'Ω': '*w'
-        }
-        
-        return [{'letter': letter, 'code': code} for letter, code in greek_letter_map.items()]
+        return list(_GREEK_LETTERS)
     
-    def generate_entry_urls_for_letter(self, letter_info: Dict) -> List[Dict]:
+    def generate_entry_urls_for_letter(self, letter_info: Dict, letter_html: Optional[str] = None) -> List[Dict]:
         """Generate URLs for entries starting with a specific letter.
         This uses the known URL pattern format for the LSJ lexicon entries.
+        The letter page is fetched here unless the caller already has it.
         """
         letter = letter_info['letter']
-        code = letter_info['code']
         
         # First get the main letter page to see its full definition
-        letter_url = f"{LSJ_URL}:alphabetic%20letter={code}"
-        letter_html = self._make_request(letter_url)
+        letter_url = letter_info['url']
+        if letter_html is None:
+            letter_html = self._make_request(letter_url)
         
         entries = []
         
         # Add the main letter entry
         if letter_html:
-            soup = BeautifulSoup(letter_html, 'lxml')
-            text_div = soup.select_one('div.text')
+            tree = LexborHTMLParser(letter_html)
+            text_div = tree.css_first(TEXT_SELECTOR)
             
             if text_div:
                 entries.append({
@@ -102,116 +158,66 @@ class LSJEntryExtractor:
                     'is_letter': True
                 })
         
-        # Based on the LSJ organization, we'll generate URLs for common entry patterns
-        # For example, for letter Alpha (Α), we might have entries like:
-        # - ἄα
-        # - ἀάατος
-        # - ἀβακέως
-        # etc.
-        
-        # Using direct entry format:
-        # https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057:entry=a)a/atos
-        
-        # For Greek letters, the Perseus site uses a transliteration system
-        # Where Greek characters are represented in ASCII:
-        # α = a, β = b, γ = g, etc.
-        # And diacritics have special codes:
-        # smooth breathing (᾿) = ), rough breathing (῾) = (, 
-        # acute accent (´) = /, grave accent (`) = \, circumflex (῀) = =
-        
-        # For demonstration, we'll generate entries for common combinations
-        # In a real implementation, we would need a comprehensive list
-        
-        # Common Greek words for each letter
-        if letter == 'Α':
-            # Some common Alpha entries with their transliterated codes
-            common_entries = [
-                ('ἄα', 'a)/a'),                   # a with smooth breathing and acute
-                ('ἀάατος', 'a)a/atos'),           # combination with smooth breathing and acute
-                ('ἀβακέως', 'a)bake/ws'),         # alpha-beta combination
-                ('ἀγαθός', 'a)gaqo/s'),           # alpha-gamma-theta
-                ('ἄγαν', 'a)/gan'),               # alpha-gamma
-                ('ἀδελφός', 'a)delfo/s'),         # alpha-delta-epsilon
-                ('ἀήρ', 'a)h/r'),                 # alpha-eta
-                ('αἰδώς', 'ai)dw/s'),             # alpha-iota
-                ('ἄκρον', 'a)/kron'),             # alpha-kappa
-                ('ἀλήθεια', 'a)lh/qeia')          # alpha-lambda-eta
-            ]
-        elif letter == 'Β':
-            common_entries = [
-                ('βαίνω', 'bai/nw'),              # beta-alpha-iota
-                ('βάλλω', 'ba/llw'),              # beta-alpha-lambda
-                ('βασιλεύς', 'basileu/s'),        # beta-alpha-sigma
-                ('βέλος', 'be/los'),              # beta-epsilon
-                ('βίος', 'bi/os'),                # beta-iota
-                ('βλέπω', 'ble/pw'),              # beta-lambda
-                ('βοή', 'boh/'),                  # beta-omicron
-                ('βούλομαι', 'bou/lomai'),        # beta-omicron-upsilon
-                ('βραχύς', 'braxu/s'),            # beta-rho
-                ('βῶλος', 'bw=los')               # beta-omega
-            ]
-        elif letter == 'Γ':
-            common_entries = [
-                ('γαῖα', 'gai=a'),                # gamma-alpha-iota
-                ('γάλα', 'ga/la'),                # gamma-alpha
-                ('γέ', 'ge/'),                    # gamma-epsilon
-                ('γῆ', 'gh='),                    # gamma-eta
-                ('γίγνομαι', 'gi/gnomai'),        # gamma-iota-gamma
-                ('γλαυκός', 'glauko/s'),          # gamma-lambda
-                ('γνώμη', 'gnw/mh'),              # gamma-nu
-                ('γόνυ', 'go/nu'),                # gamma-omicron
-                ('γράφω', 'gra/fw'),              # gamma-rho
-                ('γυνή', 'gunh/')                 # gamma-upsilon
-            ]
-        else:
-            # Add more entries for other letters as needed
-            common_entries = []
-        
         # Add the common entries to our list
-        for word, transliteration in common_entries:
-            entry_url = f"{LSJ_URL}:entry={transliteration}"
-            
-            entries.append({
-                'id': f"{letter}_{word}",
-                'letter': letter,
-                'word': word,
-                'url': entry_url,
-                'transliteration': transliteration,
-                'is_letter': False
-            })
+        entries.extend(_COMMON_ENTRY_INFOS.get(letter, ()))
         
         return entries
     
-    def extract_entry_content(self, entry_info: Dict) -> Dict:
-        """Extract the content of a dictionary entry"""
+    def extract_entry_content(self, entry_info: Dict, prefetched_html: Optional[str] = None) -> Dict:
+        """Extract the content of a dictionary entry.
+        Pass prefetched_html when the page is already in hand, e.g. the letter page for the main letter entry.
+        """
+        url = entry_info['url']
+        
+        logger.info(f"Extracting entry: {entry_info['word']} ({url})")
+        html = prefetched_html if prefetched_html is not None else self._make_request(url)
+        
+        return self._process_entry(entry_info, html)
+
+    async def _aextract_entry_content(self, client: httpx.AsyncClient, entry_info: Dict,
+                                      sem: asyncio.Semaphore, prefetched_html: Optional[str] = None) -> Dict:
+        """Async counterpart of extract_entry_content"""
         url = entry_info['url']
         
         logger.info(f"Extracting entry: {entry_info['word']} ({url})")
-        html = self._make_request(url)
+        if prefetched_html is not None:
+            html = prefetched_html
+        else:
+            html = await self._afetch(client, url, sem)
+        
+        return self._process_entry(entry_info, html)
+
+    def _process_entry(self, entry_info: Dict, html: Optional[str]) -> Dict:
+        """Parse a fetched entry page and store its content"""
+        url = entry_info['url']
         
         if not html:
             logger.error(f"Failed to retrieve entry: {url}")
             return {**entry_info, 'content': {'text': '', 'html': ''}, 'success': False}
         
-        soup = BeautifulSoup(html, 'lxml')
-        text_div = soup.select_one('div.text')
+        tree = LexborHTMLParser(html)
+        text_div = tree.css_first(TEXT_SELECTOR)
         
         if not text_div:
             logger.warning(f"No content found for entry: {url}")
             return {**entry_info, 'content': {'text': '', 'html': ''}, 'success': False}
         
         content = {
-            'text': text_div.get_text().strip(),
-            'html': str(text_div)
+            'text': text_div.text().strip(),
+            'html': text_div.html
         }
         
         # Store in database
-        self.db.store_entry(entry_info['id'], {**entry_info, 'content': content, 'success': True})
+        self._queue_entry(entry_info['id'], {**entry_info, 'content': content, 'success': True})
         
         return {**entry_info, 'content': content, 'success': True}
     
-    def run(self, limit_letters: int = None, limit_entries: int = None):
+    def run(self, limit_letters: int = None, limit_entries: int = None, concurrency: int = CONCURRENCY):
         """Run the extractor for LSJ entries"""
+        return asyncio.run(self.arun(limit_letters, limit_entries, concurrency))
+
+    async def arun(self, limit_letters: int = None, limit_entries: int = None, concurrency: int = CONCURRENCY):
+        """Extract each letter's entries concurrently, one letter at a time"""
         # Get all Greek letters
         greek_letters = self.get_greek_letters_with_codes()
         logger.info(f"Found {len(greek_letters)} Greek letters")
@@ -219,32 +225,53 @@ class LSJEntryExtractor:
         if limit_letters:
             greek_letters = greek_letters[:limit_letters]
         
+        sem = asyncio.Semaphore(concurrency)
+        # Entries stored by earlier runs are skipped unless refreshing, as are URLs already queued in this one
+        done = set() if self.refresh else await asyncio.to_thread(self.db.get_lemmas)
+        seen_urls: Set[str] = set()
         all_entries = []
-        for letter_info in greek_letters:
-            letter = letter_info['letter']
-            logger.info(f"Processing letter: {letter}")
-            
-            # Generate entry URLs for this letter
-            entries = self.generate_entry_urls_for_letter(letter_info)
-            
-            if limit_entries:
-                entries = entries[:limit_entries]
-            
-            for entry_info in entries:
-                # Extract the content for this entry
-                extracted = self.extract_entry_content(entry_info)
-                all_entries.append(extracted)
+        async with self._async_client(CONCURRENCY) as client:
+            for letter_info in greek_letters:
+                letter = letter_info['letter']
+                logger.info(f"Processing letter: {letter}")
+                
+                # Generate entry URLs for this letter; a failed fetch just skips the main letter entry
+                letter_html = await self._afetch(client, letter_info['url'], sem)
+                entries = self.generate_entry_urls_for_letter(letter_info, letter_html or '')
+                
+                if limit_entries:
+                    entries = entries[:limit_entries]
+                
+                pending = []
+                for entry_info in entries:
+                    if entry_info['id'] in done or entry_info['url'] in seen_urls:
+                        continue
+                    seen_urls.add(entry_info['url'])
+                    pending.append(entry_info)
+                if len(pending) < len(entries):
+                    logger.info(f"Skipping {len(entries) - len(pending)} entries already extracted for letter {letter}")
+                entries = pending
+                
+                # Extract the content for this letter's entries; the main letter entry
+                # reuses the letter page fetched above instead of requesting it again
+                extracted = await asyncio.gather(*(
+                    self._aextract_entry_content(
+                        client, entry_info, sem,
+                        letter_html if entry_info.get('is_letter') else None
+                    )
+                    for entry_info in entries
+                ))
+                all_entries.extend(extracted)
         
+        self._flush()
         return all_entries
     
     def export_results(self, output_path: str = "lsj_entries_export.json"):
         """Export the scraped entries to a JSON file"""
-        entries = self.db.get_all_entries()
+        # Streamed row by row from the database rather than loaded into memory
+        count = self.db.export_to_json(output_path)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(entries, f, ensure_ascii=False, indent=2)
-            
-        logger.info(f"Exported {len(entries)} entries to {output_path}")
+        logger.info(f"Exported {count} entries to {output_path}")
 
 def main():
     """Main entry point"""
@@ -259,6 +286,8 @@ def main():
                         help="Output file path")
     parser.add_argument("--force", action="store_true",
                         help="Force running without limits")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Refetch every page instead of reusing pages cached by earlier runs")
     
     args = parser.parse_args()
     
@@ -267,9 +296,9 @@ def main():
         logger.info("Use --force to run without limits or specify limits with --limit-letters and --limit-entries.")
         return
     
-    extractor = LSJEntryExtractor(delay=args.delay)
-    extractor.run(args.limit_letters, args.limit_entries)
-    extractor.export_results(args.output)
+    with LSJEntryExtractor(delay=args.delay, refresh=args.refresh) as extractor:
+        extractor.run(args.limit_letters, args.limit_entries)
+        extractor.export_results(args.output)
     
     logger.info(f"Extraction complete. Results exported to {args.output}")
 
@@ -1,19 +1,23 @@
 import asyncio
-import json
 import logging
 import os
-import time
 from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
-from urllib.parse import quote, urljoin, urlparse, parse_qs
+from urllib.parse import quote, urlparse, parse_qs
 
-from playwright.async_api import async_playwright, Page
+import httpx
+from playwright.async_api import async_playwright, Page, TimeoutError as PlaywrightTimeoutError
+from selectolax.lexbor import LexborHTMLParser
 from src.database import Database
+from src.fetcher import (THROTTLE_STATUSES, USER_AGENT, RequestPacer, perseus_url, retry_after, run_async,
+                         store_batch)
 
 # Configuration
 CONCURRENCY = 3  # Max concurrent requests
 REQUEST_DELAY = 1.2  # Seconds between requests
 MAX_RETRIES = 3  # Maximum retry attempts for failed requests
+BATCH_SIZE = 100  # Entries buffered per database transaction
+READY_TIMEOUT = 2000  # Milliseconds to wait for a page's content selector; the DOM is complete at DOMContentLoaded
 
 # Set up logging
 logging.basicConfig(
@@ -28,148 +32,205 @@ LSJ_URL = "https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.00
 
 class LSJScraper:
     def __init__(self, delay: float = REQUEST_DELAY):
-        self.delay = delay
-        self.last_request_time = 0
+        # Spaces request starts across concurrent tasks, HTTP and browser alike
+        self.pacer = RequestPacer(delay)
         self.db = Database("lsj.sqlite")
+        self._pending: List[Tuple[str, Dict]] = []
+        self._batch_size = BATCH_SIZE
         self.playwright = None
         self.browser = None
         self.context = None
+        self.http = None
+        self.page_pool: Optional[asyncio.Queue] = None
+        self._browser_lock = asyncio.Lock()
 
     async def __aenter__(self):
-        """Set up Playwright browser"""
-        self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch()
-        self.context = await self.browser.new_context()
+        """Set up the plain HTTP client; the browser is only started if a fetch falls back to it"""
+        # Perseus pages are server-rendered, so they are fetched over one pooled connection
+        # and the browser is only a fallback
+        self.http = httpx.AsyncClient(
+            http2=True,
+            headers={'User-Agent': USER_AGENT},
+            limits=httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY,
+                                keepalive_expiry=30.0),
+            timeout=30.0,
+        )
         return self
 
+    async def _start_browser(self):
+        """Launch the browser and its pool of pages on first use, shared for the scraper's lifetime"""
+        async with self._browser_lock:
+            if self.context:
+                return
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch()
+            # Perseus renders its pages server-side, so the DOM is complete without running scripts
+            self.context = await self.browser.new_context(java_script_enabled=False)
+            # Pages are reused across URLs; goto replaces whatever a page showed before
+            self.page_pool = asyncio.Queue()
+            for _ in range(CONCURRENCY):
+                await self.page_pool.put(await self.context.new_page())
+
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Clean up Playwright resources"""
+        if self.http:
+            await self.http.aclose()
         if self.context:
             await self.context.close()
         if self.browser:
             await self.browser.close()
         if self.playwright:
             await self.playwright.stop()
+        await self._flush()
+        self.db.close()
+
+    async def _queue_entry(self, key: str, entry: Dict):
+        """Buffer an entry, writing the buffer out once it reaches the batch size"""
+        self._pending.append((key, entry))
+        if len(self._pending) >= self._batch_size:
+            await self._flush()
+
+    async def _flush(self):
+        """Write buffered entries in a single transaction, off the event loop"""
+        if self._pending:
+            # Swap the buffer out first so entries queued during the write go into the next batch
+            pending, self._pending = self._pending, []
+            await asyncio.to_thread(store_batch, self.db, pending)
+
+    async def _hold_off(self, response: httpx.Response):
+        """Push back every task's next request by the server's Retry-After, or by one delay"""
+        wait = retry_after(response.headers.get('Retry-After'))
+        wait = self.pacer.delay if wait is None else wait
+        logger.warning(f"Throttled with {response.status_code}, holding requests for {wait:.1f}s: {response.url}")
+        # Delays the retry of this page as well as everyone else's next fetch
+        self.pacer.hold(wait)
+
+    async def _fetch_http(self, url: str) -> Optional[str]:
+        """Fetch a page's raw HTML over plain HTTP, or None if the server can't be reached.
+        Throttled requests are retried after holding off; other error statuses raise HTTPStatusError.
+        """
+        for attempt in range(MAX_RETRIES):
+            await asyncio.sleep(self.pacer.reserve())
+            try:
+                response = await self.http.get(url)
+            except httpx.TransportError as e:
+                logger.warning(f"HTTP fetch failed for {url}, falling back to the browser: {str(e)}")
+                return None
+            if response.status_code in THROTTLE_STATUSES and attempt < MAX_RETRIES - 1:
+                # The retry's reserve() waits out the hold
+                await self._hold_off(response)
+                continue
+            response.raise_for_status()
+            return response.text
+
+    async def _render_html(self, url: str, ready_selector: str = 'div.text') -> str:
+        """Load a page in the browser and return its rendered HTML for in-process parsing"""
+        await self._start_browser()
+        await asyncio.sleep(self.pacer.reserve())
+        
+        page = await self.page_pool.get()
+        try:
+            # Wait for the content we parse rather than for the network to go quiet
+            await page.goto(url, wait_until='domcontentloaded')
+            try:
+                await page.wait_for_selector(ready_selector, state='attached', timeout=READY_TIMEOUT)
+            except PlaywrightTimeoutError:
+                logger.debug(f"{ready_selector} not found on {url}")
+            return await page.content()
+        finally:
+            await self.page_pool.put(page)
 
-    async def _wait_for_delay(self):
-        """Ensure we respect the delay between requests."""
-        now = time.time()
-        time_since_last = now - self.last_request_time
-        if time_since_last < self.delay:
-            await asyncio.sleep(self.delay - time_since_last)
-        self.last_request_time = time.time()
+    async def _get_html(self, url: str, ready_selector: str = 'div.text') -> str:
+        """Fetch a page over HTTP, rendering it in the browser only if the server can't be reached"""
+        try:
+            html = await self._fetch_http(url)
+        except httpx.HTTPStatusError as e:
+            # The browser would get the same error page, so the page is treated as empty
+            logger.error(f"HTTP {e.response.status_code} for {url}")
+            return ''
+        if html is None:
+            html = await self._render_html(url, ready_selector)
+        return html
 
     async def scrape_alphabetic_letters(self) -> List[Dict]:
         """Scrape the alphabetic letters from the LSJ lexicon page"""
-        await self._wait_for_delay()
+        tree = LexborHTMLParser(await self._get_html(LSJ_URL, 'div.alphabetic_letter'))
         
-        page = await self.context.new_page()
-        try:
-            await page.goto(LSJ_URL, wait_until='networkidle')
-            
-            # Get all the alphabetic letter links
-            letters = []
-            
-            # Find all links to alphabetic letters
-            elements = await page.query_selector_all('div.alphabetic_letter a')
-            for element in elements:
-                text = await element.text_content()
-                href = await element.get_attribute('href')
-                
-                if href and text:
-                    letters.append({
-                        'letter': text.strip(),
-                        'url': urljoin(BASE_URL, href)
-                    })
+        # Get all the alphabetic letter links
+        letters = []
+        
+        # Find all links to alphabetic letters
+        for element in tree.css('div.alphabetic_letter a'):
+            text = element.text()
+            href = element.attrs.get('href')
             
-            return letters
-        finally:
-            await page.close()
+            if href and text:
+                letters.append({
+                    'letter': text.strip(),
+                    'url': perseus_url(href)
+                })
+        
+        return letters
 
     async def scrape_entry_groups(self, letter_url: str) -> List[Dict]:
         """Scrape all the entry groups for a given letter"""
-        await self._wait_for_delay()
+        tree = LexborHTMLParser(await self._get_html(letter_url, 'div.entry_group'))
         
-        page = await self.context.new_page()
-        try:
-            await page.goto(letter_url, wait_until='networkidle')
-            
-            # Get all the entry group links
-            groups = []
-            
-            elements = await page.query_selector_all('div.entry_group a')
-            for element in elements:
-                text = await element.text_content()
-                href = await element.get_attribute('href')
-                
-                if href and text:
-                    groups.append({
-                        'group': text.strip(),
-                        'url': urljoin(BASE_URL, href)
-                    })
+        # Get all the entry group links
+        groups = []
+        
+        for element in tree.css('div.entry_group a'):
+            text = element.text()
+            href = element.attrs.get('href')
             
-            return groups
-        finally:
-            await page.close()
+            if href and text:
+                groups.append({
+                    'group': text.strip(),
+                    'url': perseus_url(href)
+                })
+        
+        return groups
 
     async def scrape_entry_definitions(self, group_url: str) -> Optional[List[Dict]]:
         """Scrape the definitions of entries in a group"""
-        await self._wait_for_delay()
-        
-        page = await self.context.new_page()
         try:
-            await page.goto(group_url, wait_until='networkidle')
+            tree = LexborHTMLParser(await self._get_html(group_url))
             
             # Check if we're on a definition page
-            definition_block = await page.query_selector('.text')
+            definition_block = tree.css_first('.text')
             
             if definition_block:
                 entries = []
                 
                 # Get all <a> elements with named anchor links
-                word_elements = await page.query_selector_all('.text a[name]')
-                
-                for word_element in word_elements:
-                    name = await word_element.get_attribute('name')
-                    
-                    # Find the definition text that follows
-                    # This is complex as the structure varies, so we'll grab the following elements
-                    definition_text = ""
+                for word_element in definition_block.css('a[name]'):
+                    name = word_element.attrs.get('name')
                     
-                    # Try to find the most appropriate way to get the definition
-                    # This might need refinement based on the actual HTML structure
-                    current_element = word_element
-                    next_word = False
-                    
-                    # Navigate through sibling elements until we reach the next word
-                    while current_element and not next_word:
-                        next_element = await current_element.evaluate_handle('el => el.nextSibling')
-                        if next_element:
-                            element_name = await next_element.evaluate('el => el.nodeName')
-                            if element_name == "A" and await next_element.evaluate('el => el.hasAttribute("name")'):
-                                next_word = True
-                            else:
-                                element_text = await next_element.evaluate('el => el.textContent || ""')
-                                definition_text += element_text
-                        
-                        current_element = next_element
+                    # The definition is everything between this anchor and the next named one
+                    definition_parts = []
+                    next_element = word_element.next
+                    while next_element is not None:
+                        if next_element.tag == 'a' and 'name' in next_element.attrs:
+                            break
+                        if next_element.tag != '-comment':
+                            definition_parts.append(next_element.text())
+                        next_element = next_element.next
                     
                     if name:
                         entries.append({
                             'word': name,
-                            'definition': definition_text.strip(),
+                            'definition': ''.join(definition_parts).strip(),
                             'url': f"{group_url}#{name}"
                         })
                 
                 return entries
             
             # If not a definition page, look for links to individual definitions
-            definition_links = await page.query_selector_all('a[href^="#"]')
             definitions = []
             
-            for link in definition_links:
-                text = await link.text_content()
-                href = await link.get_attribute('href')
+            for link in tree.css('a[href^="#"]'):
+                text = link.text()
+                href = link.attrs.get('href')
                 
                 if href and text and href.startswith('#'):
                     definitions.append({
@@ -181,39 +242,32 @@ class LSJScraper:
         except Exception as e:
             logger.error(f"Error scraping definitions from {group_url}: {str(e)}")
             return None
-        finally:
-            await page.close()
             
     async def extract_page_content(self, url: str) -> Dict:
         """Extract the full HTML and text content of a page"""
-        await self._wait_for_delay()
+        tree = LexborHTMLParser(await self._get_html(url))
         
-        page = await self.context.new_page()
-        try:
-            await page.goto(url, wait_until='networkidle')
-            
-            # Get the main text content
-            text_element = await page.query_selector('.text')
-            
-            if text_element:
-                content_html = await text_element.inner_html()
-                content_text = await text_element.text_content()
-                
-                return {
-                    'url': url,
-                    'html': content_html,
-                    'text': content_text.strip()
-                }
+        # Get the main text content
+        text_element = tree.css_first('.text')
+        
+        if text_element:
+            content_html = ''.join(child.html for child in text_element.iter(include_text=True))
+            content_text = text_element.text()
             
             return {
                 'url': url,
-                'html': '',
-                'text': ''
+                'html': content_html,
+                'text': content_text.strip()
             }
-        finally:
-            await page.close()
+        
+        return {
+            'url': url,
+            'html': '',
+            'text': ''
+        }
 
-    async def run_full_crawl(self, limit_letters: int = None, limit_groups: int = None, limit_entries: int = None):
+    async def run_full_crawl(self, limit_letters: int = None, limit_groups: int = None, limit_entries: int = None,
+                             concurrency: int = CONCURRENCY):
         """Run a full crawl of the LSJ lexicon"""
         # Get all alphabetic letters
         letters = await self.scrape_alphabetic_letters()
@@ -222,51 +276,60 @@ class LSJScraper:
         if limit_letters:
             letters = letters[:limit_letters]
         
-        for letter_info in letters:
+        # Bound the number of group pages in flight; the pacer still spaces request starts
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def process_group(letter: str, group_info: Dict):
+            group = group_info['group']
+            group_url = group_info['url']
+            
+            async with semaphore:
+                logger.info(f"Processing group: {group}")
+                
+                # Store the full page content
+                page_content = await self.extract_page_content(group_url)
+            
+            # Use a safe key for database storage (group might contain characters not suitable for keys)
+            parsed_url = urlparse(group_url)
+            query_params = parse_qs(parsed_url.query)
+            group_key = f"{letter}_{group}"
+            
+            if 'doc' in query_params:
+                group_key = query_params['doc'][0]
+                
+            await self._queue_entry(group_key, {
+                'letter': letter,
+                'group': group,
+                'url': group_url,
+                'content': page_content
+            })
+        
+        async def process_letter(letter_info: Dict):
             letter = letter_info['letter']
             letter_url = letter_info['url']
             
             logger.info(f"Processing letter: {letter}")
             
-            # Get all entry groups for this letter
-            groups = await self.scrape_entry_groups(letter_url)
+            # Get all entry groups for this letter; the slot is released before its groups queue up
+            async with semaphore:
+                groups = await self.scrape_entry_groups(letter_url)
             logger.info(f"Found {len(groups)} entry groups for letter {letter}")
             
             if limit_groups:
                 groups = groups[:limit_groups]
             
-            for group_info in groups:
-                group = group_info['group']
-                group_url = group_info['url']
-                
-                logger.info(f"Processing group: {group}")
-                
-                # Store the full page content
-                page_content = await self.extract_page_content(group_url)
-                
-                # Use a safe key for database storage (group might contain characters not suitable for keys)
-                parsed_url = urlparse(group_url)
-                query_params = parse_qs(parsed_url.query)
-                group_key = f"{letter}_{group}"
-                
-                if 'doc' in query_params:
-                    group_key = query_params['doc'][0]
-                    
-                self.db.store_entry(group_key, {
-                    'letter': letter,
-                    'group': group,
-                    'url': group_url,
-                    'content': page_content
-                })
+            await asyncio.gather(*(process_group(letter, group_info) for group_info in groups))
+        
+        # Letters run concurrently too; the semaphore and the pacer bound the whole crawl
+        await asyncio.gather(*(process_letter(letter_info) for letter_info in letters))
+        
+        await self._flush()
     
     async def export_results(self, output_path: str = "lsj_lexicon_export.json"):
         """Export the scraped data to a JSON file"""
-        entries = self.db.get_all_entries()
+        count = await asyncio.to_thread(self.db.export_to_json, output_path)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(entries, f, ensure_ascii=False, indent=2)
-            
-        logger.info(f"Exported {len(entries)} entries to {output_path}")
+        logger.info(f"Exported {count} entries to {output_path}")
 
 async def main():
     """Main entry point"""
@@ -278,4 +341,4 @@ async def main():
         await scraper.export_results()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    run_async(main()) 
\ No newline at end of file
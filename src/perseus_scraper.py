@@ -1,19 +1,21 @@
 import asyncio
-import json
 import logging
 import os
-import time
 from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
-from urllib.parse import quote, urljoin
+from urllib.parse import quote
 
-from playwright.async_api import async_playwright, Page
+from playwright.async_api import async_playwright, Page, TimeoutError as PlaywrightTimeoutError
+from selectolax.lexbor import LexborHTMLParser
 from src.database import Database
+from src.fetcher import BROWSER_ARGS, RequestPacer, block_heavy_resources, perseus_url, store_batch
 
 # Configuration
 CONCURRENCY = 3  # Max concurrent requests
 REQUEST_DELAY = 1.2  # Seconds between requests
 MAX_RETRIES = 3  # Maximum retry attempts for failed requests
+READY_TIMEOUT = 10000  # Milliseconds to wait for the content a page is read for
+BATCH_SIZE = 100  # Entries buffered per database transaction
 
 # Set up logging
 logging.basicConfig(
@@ -26,20 +28,68 @@ logger = logging.getLogger(__name__)
 BASE_URL = "https://www.perseus.tufts.edu/hopper"
 LEXICON_URL = "https://www.perseus.tufts.edu/hopper/text?doc=Perseus:text:1999.04.0057"
 
+def _parse_links(html: str, selector: str) -> List[Dict]:
+    """Collect the text and absolute URL of every link matching selector"""
+    links = []
+    for element in LexborHTMLParser(html).css(selector):
+        text = element.text()
+        href = element.attrs.get('href')
+        
+        if href and text:
+            links.append({
+                'text': text.strip(),
+                'url': perseus_url(href)
+            })
+    
+    return links
+
+def _parse_entry_content(html: str, entry_url: str) -> Optional[Dict]:
+    """Extract the header and content of a rendered entry page"""
+    tree = LexborHTMLParser(html)
+    
+    # Extract the entry header
+    header_element = tree.css_first('#lexicon_header')
+    header = header_element.text() if header_element else ""
+    
+    # Extract the main content
+    content_element = tree.css_first('#lexicon_content')
+    if content_element is None:
+        return None
+    content_html = ''.join(child.html for child in content_element.iter(include_text=True))
+    
+    if content_html:
+        return {
+            'header': header.strip(),
+            'content_html': content_html,
+            'content_text': content_element.text().strip(),
+            'url': entry_url
+        }
+    
+    return None
+
 class PerseusScraper:
     def __init__(self, delay: float = REQUEST_DELAY):
-        self.delay = delay
-        self.last_request_time = 0
+        # Spaces request starts, while the semaphore bounds requests in flight
+        self.pacer = RequestPacer(delay)
+        self.sem = asyncio.Semaphore(CONCURRENCY)
+        self._pending: List[Tuple[str, Dict]] = []
+        self._batch_size = BATCH_SIZE
         self.db = Database("perseus.sqlite")
         self.playwright = None
         self.browser = None
         self.context = None
+        self.page_pool: Optional[asyncio.Queue] = None
 
     async def __aenter__(self):
         """Set up Playwright browser"""
         self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch(headless=False)
+        self.browser = await self.playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
         self.context = await self.browser.new_context()
+        await self.context.route("**/*", block_heavy_resources)
+        # Pages are reused across URLs; goto replaces whatever a page showed before
+        self.page_pool = asyncio.Queue()
+        for _ in range(CONCURRENCY):
+            await self.page_pool.put(await self.context.new_page())
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -50,99 +100,77 @@ class PerseusScraper:
             await self.browser.close()
         if self.playwright:
             await self.playwright.stop()
-
-    async def _wait_for_delay(self):
-        """Ensure we respect the delay between requests."""
-        now = time.time()
-        time_since_last = now - self.last_request_time
-        if time_since_last < self.delay:
-            await asyncio.sleep(self.delay - time_since_last)
-        self.last_request_time = time.time()
+        await self._flush()
+        self.db.close()
+
+    async def _queue_entry(self, key: str, entry: Dict):
+        """Buffer an entry, writing the buffer out once it reaches the batch size"""
+        self._pending.append((key, entry))
+        if len(self._pending) >= self._batch_size:
+            await self._flush()
+
+    async def _flush(self):
+        """Write buffered entries in a single transaction, off the event loop"""
+        if self._pending:
+            # Swap the buffer out first so entries queued during the write go into the next batch
+            pending, self._pending = self._pending, []
+            await asyncio.to_thread(store_batch, self.db, pending)
+
+    async def _goto(self, page: Page, url: str, ready_selector: str):
+        """Navigate and wait for the content we read rather than for the network to go quiet"""
+        await page.goto(url, wait_until='domcontentloaded')
+        try:
+            await page.wait_for_selector(ready_selector, state='attached', timeout=READY_TIMEOUT)
+        except PlaywrightTimeoutError:
+            logger.debug(f"{ready_selector} not found on {url}")
 
     async def scrape_letter_groups(self) -> List[Dict]:
         """Scrape the letter groups from the main lexicon page"""
-        await self._wait_for_delay()
-        
-        page = await self.context.new_page()
-        try:
-            await page.goto(LEXICON_URL, wait_until='networkidle')
+        async with self.sem:
+            await asyncio.sleep(self.pacer.reserve())
             
-            # Get all the letter group links
-            letter_groups = []
-            
-            # Find all links to letter groups
-            elements = await page.query_selector_all('div.entry_group a')
-            for element in elements:
-                text = await element.text_content()
-                href = await element.get_attribute('href')
-                
-                if href and text:
-                    letter_groups.append({
-                        'text': text.strip(),
-                        'url': urljoin(BASE_URL, href)
-                    })
-            
-            return letter_groups
-        finally:
-            await page.close()
+            page = await self.page_pool.get()
+            try:
+                await self._goto(page, LEXICON_URL, 'div.entry_group a')
+                html = await page.content()
+            finally:
+                await self.page_pool.put(page)
+        
+        # Get all the letter group links from one snapshot, not two DOM round-trips per link
+        return await asyncio.to_thread(_parse_links, html, 'div.entry_group a')
 
     async def scrape_letter_entries(self, letter_group_url: str) -> List[Dict]:
         """Scrape all the entries for a given letter group"""
-        await self._wait_for_delay()
-        
-        page = await self.context.new_page()
-        try:
-            await page.goto(letter_group_url, wait_until='networkidle')
-            
-            # Get all the entry links
-            entries = []
-            
-            elements = await page.query_selector_all('div.entry_list a')
-            for element in elements:
-                text = await element.text_content()
-                href = await element.get_attribute('href')
-                
-                if href and text:
-                    entries.append({
-                        'text': text.strip(),
-                        'url': urljoin(BASE_URL, href)
-                    })
+        async with self.sem:
+            await asyncio.sleep(self.pacer.reserve())
             
-            return entries
-        finally:
-            await page.close()
+            page = await self.page_pool.get()
+            try:
+                await self._goto(page, letter_group_url, 'div.entry_list a')
+                html = await page.content()
+            finally:
+                await self.page_pool.put(page)
+        
+        # Get all the entry links from one snapshot, not two DOM round-trips per link
+        return await asyncio.to_thread(_parse_links, html, 'div.entry_list a')
 
     async def scrape_entry_content(self, entry_url: str) -> Optional[Dict]:
         """Scrape the content of a dictionary entry"""
-        await self._wait_for_delay()
-        
-        page = await self.context.new_page()
-        try:
-            await page.goto(entry_url, wait_until='networkidle')
-            
-            # Extract the entry header
-            header_element = await page.query_selector('#lexicon_header')
-            header = await header_element.text_content() if header_element else ""
+        async with self.sem:
+            await asyncio.sleep(self.pacer.reserve())
             
-            # Extract the main content
-            content_element = await page.query_selector('#lexicon_content')
-            content_html = await content_element.inner_html() if content_element else ""
-            content_text = await content_element.text_content() if content_element else ""
-            
-            if content_html:
-                return {
-                    'header': header.strip(),
-                    'content_html': content_html,
-                    'content_text': content_text.strip(),
-                    'url': entry_url
-                }
-            
-            return None
-        except Exception as e:
-            logger.error(f"Error scraping entry {entry_url}: {str(e)}")
-            return None
-        finally:
-            await page.close()
+            page = await self.page_pool.get()
+            try:
+                await self._goto(page, entry_url, '#lexicon_content')
+                html = await page.content()
+            except Exception as e:
+                logger.error(f"Error scraping entry {entry_url}: {str(e)}")
+                return None
+            finally:
+                await self.page_pool.put(page)
+        
+        # Header and content come from one snapshot rather than a DOM read per field
+        return await asyncio.to_thread(_parse_entry_content, html, entry_url)
 
     async def extract_dictionary_structure(self):
         """Extract the overall structure of the dictionary"""
@@ -150,50 +178,60 @@ class PerseusScraper:
         
         dictionary_structure = {}
         
-        for letter_group in letter_groups[:3]:  # Limit to first 3 for testing
+        # Limit to first 3 for testing; the groups are fetched concurrently
+        letter_groups = letter_groups[:3]
+        all_entries = await asyncio.gather(*(
+            self.scrape_letter_entries(letter_group['url']) for letter_group in letter_groups
+        ))
+        
+        for letter_group, entries in zip(letter_groups, all_entries):
             logger.info(f"Processing letter group: {letter_group['text']}")
-            entries = await self.scrape_letter_entries(letter_group['url'])
             
             dictionary_structure[letter_group['text']] = {
                 'url': letter_group['url'],
                 'entries': entries
             }
             
-            # Store in database
-            self.db.store_entry(letter_group['text'], {
+            # Buffered and written to the database in batches
+            await self._queue_entry(letter_group['text'], {
                 'url': letter_group['url'],
                 'entries': entries
             })
         
+        await self._flush()
         return dictionary_structure
 
     async def run_scraper(self, max_entries_per_letter: int = 5):
         """Run the scraper to extract the dictionary content"""
         letter_groups = await self.scrape_letter_groups()
         
-        for letter_group in letter_groups:
+        async def scrape_entry(entry: Dict):
+            logger.info(f"Scraping entry: {entry['text']}")
+            entry_content = await self.scrape_entry_content(entry['url'])
+            
+            if entry_content:
+                # Buffered and written to the database in batches
+                await self._queue_entry(entry['text'], entry_content)
+        
+        async def process_letter_group(letter_group: Dict):
             logger.info(f"Processing letter group: {letter_group['text']}")
             entries = await self.scrape_letter_entries(letter_group['url'])
             
             # Limit the number of entries to scrape
             entries_to_process = entries[:max_entries_per_letter]
             
-            for entry in entries_to_process:
-                logger.info(f"Scraping entry: {entry['text']}")
-                entry_content = await self.scrape_entry_content(entry['url'])
-                
-                if entry_content:
-                    # Store entry in database
-                    self.db.store_entry(entry['text'], entry_content)
+            await asyncio.gather(*(scrape_entry(entry) for entry in entries_to_process))
+        
+        # Groups and their entries run concurrently; the semaphore and the pacer bound the crawl
+        await asyncio.gather(*(process_letter_group(letter_group) for letter_group in letter_groups))
+        
+        await self._flush()
 
     async def export_results(self, output_path: str = "perseus_lexicon_export.json"):
         """Export the scraped data to a JSON file"""
-        entries = self.db.get_all_entries()
+        count = await asyncio.to_thread(self.db.export_to_json, output_path)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(entries, f, ensure_ascii=False, indent=2)
-            
-        logger.info(f"Exported {len(entries)} entries to {output_path}")
+        logger.info(f"Exported {count} entries to {output_path}")
 
 async def main():
     """Main entry point"""
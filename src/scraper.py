@@ -1,19 +1,32 @@
 import asyncio
-import json
+import functools
 import logging
 import os
+import random
 from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
 import unicodedata
 from urllib.parse import quote
+from datetime import datetime
+import httpx
+import orjson
 from playwright.async_api import async_playwright
+from selectolax.lexbor import LexborHTMLParser
 from src.database import Database
+from src.fetcher import (BROWSER_ARGS, USER_AGENT, RequestPacer, block_heavy_resources, retry_after, run_async,
+                         store_batch)
 import time
 
 # Configuration
 CONCURRENCY = 3  # Max concurrent requests
 REQUEST_DELAY = 1.2  # Seconds between requests
 MAX_RETRIES = 3  # Maximum retry attempts for failed requests
+BATCH_SIZE = 100  # Entries buffered per database transaction
+RETRY_STATUSES = (429, 500, 502, 503, 504)  # Responses worth retrying; other errors fall back at once
+MAX_BACKOFF = 30.0  # Ceiling in seconds for a single retry wait
+FAILURE_THRESHOLD = 5  # Consecutive API failures before all API requests pause
+FAILURE_COOLDOWN = 60.0  # Seconds the API is left alone once the threshold is hit
+API_CACHE_TTL = 7 * 24 * 3600  # Seconds a cached API response is reused before it is fetched again
 
 # Set up logging
 logging.basicConfig(
@@ -24,13 +37,93 @@ logger = logging.getLogger(__name__)
 
 # Base URLs
 BASE_URL = "https://logeion.uchicago.edu"
+# JSON endpoint the Logeion front end loads entries from
+LOGEION_API_URL = "https://anastrophe.uchicago.edu/logeion-api/detail"
 
+# Links to other Greek lemmas inside an entry
+RELATED_FORM_SELECTOR = 'a.greek[href^="/"]'
+
+# Lemmas recur across letters, retries and related forms, so each URL is built once
+@functools.lru_cache(maxsize=8192)
 def build_url(lemma: str) -> str:
     """Build URL with proper Unicode normalization and encoding"""
     lemma = unicodedata.normalize("NFC", lemma)
     encoded = quote(lemma)
     return f"{BASE_URL}/{encoded}"
 
+@functools.lru_cache(maxsize=8192)
+def build_api_url(lemma: str) -> str:
+    """Build the API detail URL for a lemma, normalized the same way as build_url"""
+    lemma = unicodedata.normalize("NFC", lemma)
+    return str(httpx.URL(LOGEION_API_URL, params={'w': lemma, 'type': 'normal'}))
+
+def _parse_api_detail(data, keep_html: bool = True) -> Optional[Dict]:
+    """Turn a Logeion API detail response into entry data, or None if it holds no definitions"""
+    detail = data.get('detail') if isinstance(data, dict) else None
+    if not isinstance(detail, dict):
+        return None
+    
+    entries = []
+    related_forms = []
+    for dico in detail.get('dicos') or ():
+        source = dico.get('dname') or ''
+        for html in dico.get('es') or ():
+            tree = LexborHTMLParser(html)
+            entries.append({
+                'source': source.strip(),
+                'definition': tree.body.text().strip() if tree.body else '',
+                'html': html if keep_html else ''
+            })
+            for link in tree.css(RELATED_FORM_SELECTOR):
+                text = link.text().strip()
+                if text:
+                    related_forms.append(text)
+    
+    if not entries:
+        return None
+    return {
+        'definitions': entries,
+        # The same form is often linked from several dictionaries; keep the first of each
+        'related_forms': list(dict.fromkeys(related_forms))
+    }
+
+def _parse_api_body(body: str, keep_html: bool = True) -> Optional[Dict]:
+    """Parse a raw Logeion API detail response into entry data"""
+    return _parse_api_detail(orjson.loads(body), keep_html)
+
+def _parse_entry_page(html: str, keep_html: bool = True) -> Optional[Dict]:
+    """Extract the dictionary entries and related forms from a rendered Logeion page"""
+    tree = LexborHTMLParser(html)
+    
+    # Get all dictionary entries
+    entries = []
+    for entry in tree.css('.dictionary-entry'):
+        source_elem = entry.css_first('.dictionary-name')
+        definition_elem = entry.css_first('.definition')
+        
+        if source_elem and definition_elem:
+            entries.append({
+                'source': source_elem.text().strip(),
+                'definition': definition_elem.text().strip(),
+                'html': ''.join(child.html for child in definition_elem.iter(include_text=True)) if keep_html else ''
+            })
+    
+    if not entries:
+        return None
+    
+    # Get related forms
+    related_forms = []
+    for link in tree.css(RELATED_FORM_SELECTOR):
+        text = link.text().strip()
+        if text:
+            related_forms.append(text)
+    
+    return {
+        'definitions': entries,
+        # The same form is often linked from several dictionaries; keep the first of each
+        'related_forms': list(dict.fromkeys(related_forms))
+    }
+
 # Greek letter mapping
 GREEK_LETTERS = {
     'α': 'alpha',
@@ -59,158 +152,283 @@ GREEK_LETTERS = {
     'ω': 'omega'
 }
 
-# Common Greek lemmas for each letter
+# Precomposed and capital Greek letters mapped to their bare lowercase base, e.g. ἀ, Ἀ and ά all to α,
+# so a lemma's initial can be matched against the keys above with one str.translate
+_BASE_LETTERS = str.maketrans({
+    chr(code): unicodedata.normalize('NFD', chr(code))[0].lower()
+    for code in (*range(0x0386, 0x0400), *range(0x1F00, 0x2000))
+    if unicodedata.category(chr(code)).startswith('L')
+})
+
+# Seed lemmas for each letter; related forms found while scraping extend the set
 COMMON_GREEK_LEMMAS = {
-    'α': ['ἀγαθός', 'ἄγω', 'ἀνήρ', 'ἄνθρωπος', 'ἀρχή'],
-    'β': ['βαίνω', 'βάλλω', 'βασιλεύς', 'βίος', 'βούλομαι'],
-    'γ': ['γῆ', 'γίγνομαι', 'γιγνώσκω', 'γράφω', 'γυνή'],
-    'δ': ['δεῖ', 'δέχομαι', 'δῆμος', 'διά', 'δίδωμι'],
-    'ε': ['ἐγώ', 'εἰμί', 'εἶπον', 'ἔρχομαι', 'ἔχω'],
-    'ζ': ['ζάω', 'ζεύς', 'ζητέω', 'ζωή', 'ζῷον'],
-    'η': ['ἡγέομαι', 'ἥκω', 'ἡμέρα', 'ἥρως', 'ἡσυχία'],
-    'θ': ['θάλασσα', 'θάνατος', 'θεός', 'θυμός', 'θύω'],
-    'ι': ['ἰδεῖν', 'ἱερός', 'ἵημι', 'ἵππος', 'ἴσος'],
-    'κ': ['καί', 'καλέω', 'καλός', 'κατά', 'κεῖμαι'],
-    'λ': ['λαμβάνω', 'λέγω', 'λείπω', 'λόγος', 'λύω'],
-    'μ': ['μάχη', 'μέγας', 'μένω', 'μή', 'μόνος'],
-    'ν': ['ναῦς', 'νέος', 'νῆσος', 'νικάω', 'νόμος'],
-    'ξ': ['ξένος', 'ξίφος', 'ξύλον', 'ξυνός', 'ξύν'],
-    'ο': ['ὁδός', 'οἶδα', 'οἶκος', 'ὄνομα', 'ὁράω'],
-    'π': ['παῖς', 'πᾶς', 'πατήρ', 'πόλις', 'πρός'],
-    'ρ': ['ῥέω', 'ῥήτωρ', 'ῥίπτω', 'ῥώμη', 'ῥώννυμι'],
-    'σ': ['σοφία', 'σοφός', 'στρατός', 'σύ', 'σῶμα'],
-    'τ': ['τάσσω', 'τε', 'τίθημι', 'τις', 'τόπος'],
-    'υ': ['ὕδωρ', 'υἱός', 'ὕπνος', 'ὑπό', 'ὕστερος'],
-    'φ': ['φαίνω', 'φέρω', 'φημί', 'φίλος', 'φύσις'],
-    'χ': ['χαίρω', 'χείρ', 'χρή', 'χρόνος', 'χώρα'],
-    'ψ': ['ψεύδω', 'ψηφίζομαι', 'ψυχή', 'ψύχω', 'ψαύω'],
-    'ω': ['ὦ', 'ὧδε', 'ὥρα', 'ὡς', 'ὠφελέω']
+    'α': frozenset({'ἀγαθός', 'ἄγω', 'ἀνήρ', 'ἄνθρωπος', 'ἀρχή'}),
+    'β': frozenset({'βαίνω', 'βάλλω', 'βασιλεύς', 'βίος', 'βούλομαι'}),
+    'γ': frozenset({'γῆ', 'γίγνομαι', 'γιγνώσκω', 'γράφω', 'γυνή'}),
+    'δ': frozenset({'δεῖ', 'δέχομαι', 'δῆμος', 'διά', 'δίδωμι'}),
+    'ε': frozenset({'ἐγώ', 'εἰμί', 'εἶπον', 'ἔρχομαι', 'ἔχω'}),
+    'ζ': frozenset({'ζάω', 'ζεύς', 'ζητέω', 'ζωή', 'ζῷον'}),
+    'η': frozenset({'ἡγέομαι', 'ἥκω', 'ἡμέρα', 'ἥρως', 'ἡσυχία'}),
+    'θ': frozenset({'θάλασσα', 'θάνατος', 'θεός', 'θυμός', 'θύω'}),
+    'ι': frozenset({'ἰδεῖν', 'ἱερός', 'ἵημι', 'ἵππος', 'ἴσος'}),
+    'κ': frozenset({'καί', 'καλέω', 'καλός', 'κατά', 'κεῖμαι'}),
+    'λ': frozenset({'λαμβάνω', 'λέγω', 'λείπω', 'λόγος', 'λύω'}),
+    'μ': frozenset({'μάχη', 'μέγας', 'μένω', 'μή', 'μόνος'}),
+    'ν': frozenset({'ναῦς', 'νέος', 'νῆσος', 'νικάω', 'νόμος'}),
+    'ξ': frozenset({'ξένος', 'ξίφος', 'ξύλον', 'ξυνός', 'ξύν'}),
+    'ο': frozenset({'ὁδός', 'οἶδα', 'οἶκος', 'ὄνομα', 'ὁράω'}),
+    'π': frozenset({'παῖς', 'πᾶς', 'πατήρ', 'πόλις', 'πρός'}),
+    'ρ': frozenset({'ῥέω', 'ῥήτωρ', 'ῥίπτω', 'ῥώμη', 'ῥώννυμι'}),
+    'σ': frozenset({'σοφία', 'σοφός', 'στρατός', 'σύ', 'σῶμα'}),
+    'τ': frozenset({'τάσσω', 'τε', 'τίθημι', 'τις', 'τόπος'}),
+    'υ': frozenset({'ὕδωρ', 'υἱός', 'ὕπνος', 'ὑπό', 'ὕστερος'}),
+    'φ': frozenset({'φαίνω', 'φέρω', 'φημί', 'φίλος', 'φύσις'}),
+    'χ': frozenset({'χαίρω', 'χείρ', 'χρή', 'χρόνος', 'χώρα'}),
+    'ψ': frozenset({'ψεύδω', 'ψηφίζομαι', 'ψυχή', 'ψύχω', 'ψαύω'}),
+    'ω': frozenset({'ὦ', 'ὧδε', 'ὥρα', 'ὡς', 'ὠφελέω'})
 }
 
 class LogeionScraper:
-    def __init__(self, delay: float = REQUEST_DELAY):
-        self.delay = delay
-        self.last_request_time = 0
+    def __init__(self, delay: float = REQUEST_DELAY, keep_html: bool = True, refresh: bool = False):
+        # Definitions HTML roughly doubles each stored entry; text-only runs drop it
+        self.keep_html = keep_html
+        # Ask the API again instead of reusing cached responses, e.g. while retrying failed lemmas
+        self.refresh = refresh
+        # Spaces request starts, while the semaphore bounds requests in flight
+        self.pacer = RequestPacer(delay)
+        self.sem = asyncio.Semaphore(CONCURRENCY)
+        # Consecutive API failures, and the monotonic time until which API requests are paused
+        self._consecutive_failures = 0
+        self._paused_until = 0.0
+        self._pending: List[Tuple[str, Dict]] = []
+        self._batch_size = BATCH_SIZE
         self.db = Database()
+        # Keys of stored entries, loaded once so lemmas that were never scraped skip the database read
+        self._stored_lemmas: Set[str] = self.db.get_lemmas()
+        # Lemmas scraped this run whose batch write failed; they are recorded as failed lemmas
+        self._unstored_lemmas: Set[str] = set()
         self.playwright = None
         self.browser = None
         self.context = None
+        self.page_pool: Optional[asyncio.Queue] = None
+        self._browser_lock = asyncio.Lock()
+        self.http: Optional[httpx.AsyncClient] = None
 
     async def __aenter__(self):
-        """Set up Playwright browser"""
-        self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch()
-        self.context = await self.browser.new_context()
+        """Set up the HTTP client; the browser is only started if a lookup needs it"""
+        # Entries come from the JSON API over one multiplexed HTTP/2 connection; the browser is the fallback
+        self.http = httpx.AsyncClient(
+            http2=True,
+            # Accept-Encoding is left to httpx, which offers br alongside gzip when brotli is installed
+            headers={
+                'Accept': 'application/json',
+                'User-Agent': USER_AGENT,
+            },
+            # Idle connections outlive a retry backoff or the failure cooldown, so the
+            # DNS lookup and TLS handshake are paid once rather than after every pause
+            limits=httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY,
+                                keepalive_expiry=FAILURE_COOLDOWN + MAX_BACKOFF),
+            timeout=30.0,
+        )
         return self
 
+    async def _start_browser(self):
+        """Launch the browser and its pool of pages on first use, shared for the scraper's lifetime"""
+        async with self._browser_lock:
+            if self.context:
+                return
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+            self.context = await self.browser.new_context()
+            await self.context.route("**/*", block_heavy_resources)
+            # Pages are reused across lemmas; goto replaces whatever a page showed before
+            self.page_pool = asyncio.Queue()
+            for _ in range(CONCURRENCY):
+                await self.page_pool.put(await self.context.new_page())
+
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Clean up Playwright resources"""
+        if self.http:
+            await self.http.aclose()
         if self.context:
             await self.context.close()
         if self.browser:
             await self.browser.close()
         if self.playwright:
             await self.playwright.stop()
+        await self._flush()
+        self.db.close()
+
+    async def _queue_entry(self, key: str, entry: Dict):
+        """Buffer an entry, writing the buffer out once it reaches the batch size"""
+        self._pending.append((key, entry))
+        # A new attempt to store the lemma is under way; _flush records it again if this one fails too
+        self._unstored_lemmas.discard(key)
+        if len(self._pending) >= self._batch_size:
+            await self._flush()
+
+    async def _flush(self):
+        """Write buffered entries in a single transaction, off the event loop"""
+        if self._pending:
+            # Swap the buffer out first so entries queued during the write go into the next batch
+            pending, self._pending = self._pending, []
+            lost = set(await asyncio.to_thread(store_batch, self.db, pending))
+            self._stored_lemmas.update(lemma for lemma, _ in pending if lemma not in lost)
+            self._unstored_lemmas.update(lost)
+            # Entries that never reached the database are left for auto_retry_failed_lemmas
+            for lemma in lost:
+                await asyncio.to_thread(self.db.add_failed_lemma, lemma)
+
+    async def _await_api(self):
+        """Wait out a pause triggered by repeated API failures, then reserve a request slot"""
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await asyncio.sleep(self.pacer.reserve())
 
-    async def _wait_for_delay(self):
-        """Ensure we respect the delay between requests."""
-        now = time.time()
-        time_since_last = now - self.last_request_time
-        if time_since_last < self.delay:
-            await asyncio.sleep(self.delay - time_since_last)
-        self.last_request_time = time.time()
+    def _record_api_failure(self):
+        """Count a failed API request, pausing all API requests once failures keep piling up"""
+        self._consecutive_failures += 1
+        if self._consecutive_failures >= FAILURE_THRESHOLD:
+            logger.warning(f"{self._consecutive_failures} API failures in a row, pausing for {FAILURE_COOLDOWN:.0f}s")
+            self._paused_until = time.monotonic() + FAILURE_COOLDOWN
+            self._consecutive_failures = 0
+
+    async def _fetch_api(self, lemma: str) -> Optional[Dict]:
+        """Fetch an entry from the Logeion API, or None if the browser should be used instead"""
+        # Recent responses from earlier runs are served from the database
+        url = build_api_url(lemma)
+        if not self.refresh:
+            cached = await asyncio.to_thread(self.db.get_fetched, url, API_CACHE_TTL)
+            if cached is not None:
+                try:
+                    entry_data = await asyncio.to_thread(_parse_api_body, cached, self.keep_html)
+                except ValueError as e:
+                    logger.warning(f"Discarding unreadable cached API response for {lemma}: {str(e)}")
+                else:
+                    if entry_data is not None:
+                        return entry_data
+        
+        for attempt in range(MAX_RETRIES):
+            try:
+                await self._await_api()
+                response = await self.http.get(url)
+                if response.status_code not in RETRY_STATUSES:
+                    self._consecutive_failures = 0
+                    response.raise_for_status()
+                    # JSON decoding and the definitions HTML parse run off the event loop
+                    entry_data = await asyncio.to_thread(_parse_api_body, response.text, self.keep_html)
+                    # A response without definitions may be transient, so it is never cached
+                    if entry_data is not None:
+                        await asyncio.to_thread(self.db.mark_fetched, url, response.text)
+                    return entry_data
+                # Throttled or failing server-side: wait as long as the server asks, if it says
+                wait = retry_after(response.headers.get('Retry-After'))
+                error = f"{response.status_code} {response.reason_phrase}"
+            except httpx.TransportError as e:
+                wait = None
+                error = str(e)
+            except (httpx.HTTPError, ValueError) as e:
+                # Other client errors and malformed JSON won't improve on a retry
+                logger.warning(f"API request failed for {lemma}, falling back to the browser: {str(e)}")
+                return None
+            
+            self._record_api_failure()
+            if attempt < MAX_RETRIES - 1:
+                if wait is None:
+                    # Capped exponential backoff with full jitter, so concurrent retries don't line up
+                    wait = random.uniform(0, min(MAX_BACKOFF, self.pacer.delay * 2 ** (attempt + 1)))
+                logger.debug(f"API request for {lemma} failed ({error}), retrying in {wait:.1f}s")
+                await asyncio.sleep(wait)
+        
+        logger.warning(f"API request failed for {lemma}, falling back to the browser: {error}")
+        return None
 
     async def _make_request(self, url: str) -> Optional[Dict]:
         """Make request with Playwright and handle dynamic content"""
-        if not self.context:
-            raise RuntimeError("Browser context not initialized. Use 'async with' to create scraper.")
+        await self._start_browser()
             
         for attempt in range(MAX_RETRIES):
             try:
-                page = await self.context.new_page()
+                page = await self.page_pool.get()
                 try:
-                    # Navigate to the page and wait for network idle
-                    await page.goto(url, wait_until='networkidle')
-                    
-                    # Wait for the dictionary entries to be visible
+                    # Heavy resources are blocked, so there is no need to wait for network idle;
+                    # the entries are rendered together once the API response arrives
+                    await page.goto(url, wait_until='domcontentloaded')
                     await page.wait_for_selector('.dictionary-entry', timeout=30000)
-                    
-                    # Wait a bit more for any additional content to load
-                    await asyncio.sleep(1)
-                    
-                    # Get all dictionary entries
-                    entries = []
-                    dictionary_entries = await page.query_selector_all('.dictionary-entry')
-                    
-                    for entry in dictionary_entries:
-                        source_elem = await entry.query_selector('.dictionary-name')
-                        definition_elem = await entry.query_selector('.definition')
-                        
-                        if source_elem and definition_elem:
-                            source = await source_elem.text_content()
-                            definition = await definition_elem.text_content()
-                            html_content = await definition_elem.inner_html()
-                            
-                            entries.append({
-                                'source': source.strip(),
-                                'definition': definition.strip(),
-                                'html': html_content
-                            })
-                    
-                    # Get related forms
-                    related_forms = []
-                    greek_links = await page.query_selector_all('a.greek[href^="/"]')
-                    for link in greek_links:
-                        text = await link.text_content()
-                        if text:
-                            related_forms.append(text.strip())
-                    
-                    if entries:
-                        return {
-                            'definitions': entries,
-                            'related_forms': related_forms
-                        }
-                    else:
-                        logger.warning(f"No definitions found for URL: {url}")
-                        
-                    return None
-                    
+
+                    html = await page.content()
                 finally:
-                    await page.close()
+                    await self.page_pool.put(page)
+                
+                # Parsed in-process from one snapshot instead of several DOM round-trips per entry,
+                # on a worker thread so other lookups keep running
+                entry_data = await asyncio.to_thread(_parse_entry_page, html, self.keep_html)
+                if entry_data is None:
+                    logger.warning(f"No definitions found for URL: {url}")
+                return entry_data
                     
             except Exception as e:
                 logger.error(f"Request error: {url} ({str(e)})")
                 if attempt == MAX_RETRIES - 1:
                     return None
-                await asyncio.sleep(self.delay * (attempt + 1))
+                await asyncio.sleep(random.uniform(0, min(MAX_BACKOFF, self.pacer.delay * 2 ** (attempt + 1))))
         return None
 
     async def get_lexicon_entry(self, lemma: str) -> Optional[Dict]:
         """Fetch complete lexicon entry for a lemma"""
-        await self._wait_for_delay()
-        
-        # Check if we already have this entry
-        existing_entry = self.db.get_entry(lemma)
-        if existing_entry:
-            return existing_entry
+        # Both the API and the browser fallback need the client opened by __aenter__
+        if not self.http:
+            raise RuntimeError("Scraper not initialized. Use 'async with' to create scraper.")
+        # Check if we already have this entry; parsing large entries happens off the loop
+        if lemma in self._stored_lemmas:
+            existing_entry = await asyncio.to_thread(self.db.get_entry, lemma)
+            if existing_entry:
+                return existing_entry
 
-        url = build_url(lemma)
-        entry_data = await self._make_request(url)
+        async with self.sem:
+            entry_data = await self._fetch_api(lemma)
+            if entry_data is None:
+                await asyncio.sleep(self.pacer.reserve())
+                entry_data = await self._make_request(build_url(lemma))
         
         if entry_data:
-            # Store in database
-            self.db.store_entry(lemma, entry_data)
+            # Buffered and written in batches; serializing the definitions HTML happens off the loop
+            await self._queue_entry(lemma, entry_data)
             return entry_data
             
         return None
 
-    async def process_letter(self, letter: str) -> Tuple[int, int]:
+    async def _drain(self, queue: asyncio.Queue, handle, concurrency: int = CONCURRENCY):
+        """Run handle over queued items with a pool of workers until the queue is empty"""
+        async def worker():
+            while True:
+                item = await queue.get()
+                try:
+                    await handle(item)
+                finally:
+                    queue.task_done()
+        
+        # Workers pull items as soon as they are free instead of waiting on the slowest in a batch;
+        # the semaphore and the pacer still bound the request rate
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def process_letter(self, letter: str, concurrency: int = CONCURRENCY) -> Tuple[int, int]:
         """Process all lemmas for a given letter"""
         logger.info(f"Starting letter: {letter}")
         
-        # Start with common lemmas for this letter
-        lemmas = set(COMMON_GREEK_LEMMAS.get(letter, []))
+        # Start with common lemmas for this letter; related forms are queued as they are found
+        lemmas = set(COMMON_GREEK_LEMMAS.get(letter, frozenset()))
         logger.info(f"Starting with {len(lemmas)} seed lemmas for letter '{letter}'")
+        queue: asyncio.Queue = asyncio.Queue()
+        for lemma in lemmas:
+            queue.put_nowait(lemma)
         
         success_count = 0
         fail_count = 0
@@ -224,27 +442,20 @@ class LogeionScraper:
                     # Add any related forms to process
                     if 'related_forms' in entry:
                         for related in entry['related_forms']:
-                            if related.startswith(letter):
+                            if related[:1].translate(_BASE_LETTERS) == letter and related not in lemmas:
                                 lemmas.add(related)
+                                queue.put_nowait(related)
                 else:
                     fail_count += 1
-                    self.db.add_failed_lemma(lemma)
+                    await asyncio.to_thread(self.db.add_failed_lemma, lemma)
             except Exception as e:
                 logger.error(f"Error processing lemma {lemma}: {str(e)}")
                 fail_count += 1
-                self.db.add_failed_lemma(lemma)
+                await asyncio.to_thread(self.db.add_failed_lemma, lemma)
 
-        # Process lemmas concurrently with rate limiting
-        tasks = []
-        for lemma in lemmas:
-            if len(tasks) >= CONCURRENCY:
-                await asyncio.gather(*tasks)
-                tasks = []
-            tasks.append(process_lemma(lemma))
+        await self._drain(queue, process_lemma, concurrency)
         
-        if tasks:
-            await asyncio.gather(*tasks)
-            
+        await self._flush()
         return success_count, fail_count
 
     async def run_scraper(self, letters: List[str] = None):
@@ -267,7 +478,7 @@ class LogeionScraper:
 
     async def auto_retry_failed_lemmas(self):
         """Automatically retry failed lemmas"""
-        failed_lemmas = self.db.get_failed_lemmas()
+        failed_lemmas = await asyncio.to_thread(self.db.get_failed_lemmas)
         if not failed_lemmas:
             logger.info("No failed lemmas to retry")
             return 0, 0
@@ -281,64 +492,76 @@ class LogeionScraper:
             nonlocal success_count, still_failed
             try:
                 entry = await self.get_lexicon_entry(lemma)
-                if entry:
+                # A lemma whose write already failed in _flush stays recorded as failed
+                if entry and lemma not in self._unstored_lemmas:
                     success_count += 1
-                    self.db.remove_failed_lemma(lemma)
+                    await asyncio.to_thread(self.db.remove_failed_lemma, lemma)
                 else:
                     still_failed += 1
             except Exception as e:
                 logger.error(f"Error retrying lemma {lemma}: {str(e)}")
                 still_failed += 1
                 
-        tasks = []
+        queue: asyncio.Queue = asyncio.Queue()
         for lemma in failed_lemmas:
-            if len(tasks) >= CONCURRENCY:
-                await asyncio.gather(*tasks)
-                tasks = []
-            tasks.append(retry_lemma(lemma))
-            
-        if tasks:
-            await asyncio.gather(*tasks)
-            
+            queue.put_nowait(lemma)
+        # A cached response is what failed last time, so retries always ask the API again
+        refresh, self.refresh = self.refresh, True
+        try:
+            await self._drain(queue, retry_lemma)
+        finally:
+            self.refresh = refresh
+        
+        await self._flush()
         logger.info(f"Retry complete. Recovered: {success_count}, Still failed: {still_failed}")
         return success_count, still_failed
 
     async def export_failed_report(self, output_path: str = "failed_lemmas_report.json"):
         """Export a report of failed lemmas"""
-        failed_lemmas = self.db.get_failed_lemmas()
+        failed_lemmas = await asyncio.to_thread(self.db.get_failed_lemmas)
         report = {
             'total_failed': len(failed_lemmas),
             'failed_lemmas': list(failed_lemmas),
             'timestamp': datetime.now().isoformat()
         }
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(report, f, ensure_ascii=False, indent=2)
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
             
         logger.info(f"Failed lemmas report exported to {output_path}")
         return report
 
     async def export_results(self, output_path: str = "lexicon_export.json"):
-        """Export all successfully scraped entries"""
-        entries = self.db.get_all_entries()
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(entries, f, ensure_ascii=False, indent=2)
+        """Export all successfully scraped entries; a .jsonl path writes one entry per line"""
+        export = self.db.export_to_jsonl if output_path.endswith('.jsonl') else self.db.export_to_json
+        count = await asyncio.to_thread(export, output_path)
             
         logger.info(f"Lexicon entries exported to {output_path}")
-        return len(entries)
+        return count
 
 async def main():
     """Main entry point for the scraper"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Scrape Greek lexicon entries from Logeion")
+    parser.add_argument("--text-only", action="store_true",
+                        help="Store only definition text, dropping the definitions HTML")
+    parser.add_argument("--format", choices=["json", "jsonl"], default="json",
+                        help="Export as a single JSON object or as JSON Lines (default: json)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Query the API again instead of reusing responses cached by earlier runs")
+    
+    args = parser.parse_args()
+    
     logger.info("Starting Greek lexicon scraping...")
     
-    async with LogeionScraper() as scraper:
+    async with LogeionScraper(keep_html=not args.text_only, refresh=args.refresh) as scraper:
         # Run the scraper for all letters
         await scraper.run_scraper()
         
         # Export results
-        await scraper.export_results()
+        await scraper.export_results(f"lexicon_export.{args.format}")
         await scraper.export_failed_report()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    run_async(main()) 
\ No newline at end of file
@@ -0,0 +1,116 @@
+import json
+import sqlite3
+from collections import OrderedDict
+
+import pytest
+
+from database import ZSTD_MAGIC, Database
+
+# Schema and row format of databases written before entries were compressed
+BASELINE_SCHEMA = '''
+    CREATE TABLE entries (
+        id INTEGER PRIMARY KEY,
+        lemma TEXT NOT NULL UNIQUE,
+        data TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE failed_lemmas (
+        id INTEGER PRIMARY KEY,
+        lemma TEXT NOT NULL UNIQUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE INDEX idx_entries_lemma ON entries(lemma);
+    CREATE INDEX idx_failed_lemmas_lemma ON failed_lemmas(lemma);
+'''
+
+LEGACY_ENTRY = {'lemma': 'λόγος', 'language': 'greek', 'details': {'definitions': ['word']}}
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """A database in the baseline format holding one plain-JSON TEXT row"""
+    path = tmp_path / "baseline.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.execute('INSERT INTO entries (lemma, data) VALUES (?, ?)',
+                     ('λόγος', json.dumps(LEGACY_ENTRY, ensure_ascii=False)))
+    conn.close()
+    with Database(str(path)) as db:
+        yield db
+
+def test_reads_baseline_text_rows(baseline_db):
+    """Plain JSON TEXT rows from before compression stay readable"""
+    assert baseline_db.get_entry('λόγος') == LEGACY_ENTRY
+    assert baseline_db.get_all_entries() == {'λόγος': LEGACY_ENTRY}
+
+def test_new_rows_are_compressed(baseline_db):
+    """Entries written now are stored as zstd frames alongside the legacy rows"""
+    assert baseline_db.store_entry('ἀγαθός', {'definitions': ['good']})
+
+    raw = baseline_db.conn.execute('SELECT data FROM entries WHERE lemma = ?', ('ἀγαθός',)).fetchone()[0]
+    assert raw[:4] == ZSTD_MAGIC
+    assert baseline_db.get_entry('ἀγαθός') == {'definitions': ['good']}
+
+def test_export_mixes_legacy_and_compressed_rows(baseline_db, tmp_path):
+    """Both row formats are spliced into the export as valid JSON"""
+    baseline_db.store_entry('ἀγαθός', {'definitions': ['good']})
+
+    json_path = tmp_path / "export.json"
+    assert baseline_db.export_to_json(str(json_path)) == 2
+    assert json.loads(json_path.read_text(encoding='utf-8')) == {
+        'λόγος': LEGACY_ENTRY,
+        'ἀγαθός': {'definitions': ['good']},
+    }
+
+    jsonl_path = tmp_path / "export.jsonl"
+    assert baseline_db.export_to_jsonl(str(jsonl_path)) == 2
+    lines = [json.loads(line) for line in jsonl_path.read_text(encoding='utf-8').splitlines()]
+    assert lines == [
+        {'lemma': 'λόγος', 'data': LEGACY_ENTRY},
+        {'lemma': 'ἀγαθός', 'data': {'definitions': ['good']}},
+    ]
+
+def test_export_of_empty_database(tmp_path):
+    """An empty database exports as an empty JSON object"""
+    with Database(str(tmp_path / "empty.sqlite")) as db:
+        path = tmp_path / "export.json"
+        assert db.export_to_json(str(path)) == 0
+        assert json.loads(path.read_text(encoding='utf-8')) == {}
+
+def test_store_entry_accepts_any_json_value(tmp_path):
+    """Lists and dict subclasses are stored, not just plain dicts"""
+    with Database(str(tmp_path / "values.sqlite")) as db:
+        assert db.store_entry('list', [1, 2])
+        assert db.store_entry('ordered', OrderedDict(a=1))
+        assert db.get_entry('list') == [1, 2]
+        assert db.get_entry('ordered') == {'a': 1}
+
+def test_store_entries_rejects_unserializable_batch(tmp_path):
+    """A batch with a row that cannot be serialized fails as a whole without raising"""
+    with Database(str(tmp_path / "bad.sqlite")) as db:
+        assert not db.store_entries([('good', {'a': 1}), ('bad', {'a': object()})])
+        assert db.get_lemmas() == set()
+
+def test_store_entries_upserts(tmp_path):
+    """Storing a lemma again replaces its data"""
+    with Database(str(tmp_path / "upsert.sqlite")) as db:
+        assert db.store_entries([('a', {'v': 1}), ('b', {'v': 2})])
+        assert db.store_entries([('a', {'v': 3})])
+        assert db.get_all_entries() == {'a': {'v': 3}, 'b': {'v': 2}}
+
+def test_fetched_pages_round_trip(tmp_path):
+    """Cached page bodies come back as the text that was stored"""
+    with Database(str(tmp_path / "fetched.sqlite")) as db:
+        assert db.get_fetched('https://example.org/a') is None
+        assert db.mark_fetched('https://example.org/a', '<div class="text">ἀγαθός</div>')
+        assert db.get_fetched('https://example.org/a') == '<div class="text">ἀγαθός</div>'
+
+def test_fetched_pages_expire(tmp_path):
+    """A max_age hides cached bodies fetched longer ago than that"""
+    with Database(str(tmp_path / "expiry.sqlite")) as db:
+        db.mark_fetched('https://example.org/a', 'body')
+        assert db.get_fetched('https://example.org/a', 3600) == 'body'
+        db.conn.execute("UPDATE fetched SET fetched_at = datetime('now', '-2 hours')")
+        assert db.get_fetched('https://example.org/a', 3600) is None
+        assert db.get_fetched('https://example.org/a') == 'body'
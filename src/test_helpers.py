@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+import httpx
+from selectolax.lexbor import LexborHTMLParser
+
+from database import Database
+from direct_lsj_scraper import DirectLSJScraper
+from fetcher import RequestPacer, perseus_url, retry_after, store_batch
+from lsj_entry_extractor import LSJEntryExtractor
+
+ENTRY_HREF = 'text?doc=Perseus:text:1999.04.0057:entry=a)gaqo/s'
+ENTRY_URL = 'https://www.perseus.tufts.edu/hopper/' + ENTRY_HREF
+
+@pytest.mark.parametrize('href, expected', [
+    (ENTRY_HREF, ENTRY_URL),
+    ('/hopper/text?doc=x', 'https://www.perseus.tufts.edu/hopper/text?doc=x'),
+    ('https://example.org/page', 'https://example.org/page'),
+    ('?doc=x', 'https://www.perseus.tufts.edu/hopper/?doc=x'),
+    ('../img/a.png', 'https://www.perseus.tufts.edu/img/a.png'),
+    ('//cdn.example.org/a.js', 'https://cdn.example.org/a.js'),
+])
+def test_perseus_url(href, expected):
+    """Relative Perseus links resolve under /hopper/, not the site root"""
+    assert perseus_url(href) == expected
+
+def test_retry_after_seconds():
+    """Retry-After given in seconds, with junk and negatives handled"""
+    assert retry_after('7') == 7.0
+    assert retry_after('-3') == 0.0
+    assert retry_after(None) is None
+    assert retry_after('') is None
+    assert retry_after('soon') is None
+
+def test_retry_after_http_date():
+    """Retry-After given as an HTTP date counts down from now"""
+    later = datetime.now(timezone.utc) + timedelta(seconds=120)
+    assert 100 < retry_after(format_datetime(later, usegmt=True)) <= 120
+    earlier = datetime.now(timezone.utc) - timedelta(seconds=120)
+    assert retry_after(format_datetime(earlier, usegmt=True)) == 0.0
+
+def test_pacer_spaces_reservations():
+    """Back-to-back reservations are spaced one delay apart, and hold pushes them back"""
+    pacer = RequestPacer(10.0)
+    assert pacer.reserve() == 0.0
+    assert 9.0 < pacer.reserve() <= 10.0
+    pacer.hold(100.0)
+    assert 99.0 < pacer.reserve() <= 100.0
+
+def test_store_batch_falls_back_per_entry(tmp_path):
+    """A failed batch is stored entry by entry and only the bad entry is lost"""
+    with Database(str(tmp_path / "batch.sqlite")) as db:
+        lost = store_batch(db, [('good', {'a': 1}), ('bad', {'a': object()})])
+        assert lost == ['bad']
+        assert db.get_lemmas() == {'good'}
+
+def _groups(html: str):
+    """Parse entry groups without opening the scraper's database or HTTP client"""
+    scraper = DirectLSJScraper.__new__(DirectLSJScraper)
+    return [(g['group'], g['url']) for g in scraper.parse_entry_groups(LexborHTMLParser(html))]
+
+def test_parse_entry_groups_entry_list():
+    """Links in div.entry_list are the groups"""
+    html = f'<div class="entry_list"><a href="{ENTRY_HREF}">agathos</a><a>no href</a></div>'
+    assert _groups(html) == [('agathos', ENTRY_URL)]
+
+def test_parse_entry_groups_text_area():
+    """Inside div.text, anchors and browse links are skipped"""
+    html = f'''<div class="text">
+        <a href="#top">top</a><a href="browse?x">Browse</a><a href="{ENTRY_HREF}">agathos</a>
+    </div>'''
+    assert _groups(html) == [('agathos', ENTRY_URL)]
+
+def test_parse_entry_groups_last_resort_has_no_duplicates():
+    """Links matching both 'text' and 'entry' are returned once"""
+    html = f'''<body>
+        <a href="{ENTRY_HREF}">agathos</a><a href="about.html">About</a><a href="#x">xx</a>
+        <a href="entry=kakos">kakos</a>
+    </body>'''
+    assert _groups(html) == [('agathos', ENTRY_URL), ('kakos', perseus_url('entry=kakos'))]
+
+def _extract_first_letter(tmp_path, refresh: bool):
+    """Run the extractor over the first letter against a stub server, with 'Α_main' stored by an earlier run"""
+    with LSJEntryExtractor(str(tmp_path / "entries.sqlite"), delay=0.0, refresh=refresh) as extractor:
+        extractor.db.store_entry('Α_main', {'content': {'text': 'old'}})
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, text='<div class="text">new</div>'))
+        extractor._async_client = lambda max_connections: httpx.AsyncClient(transport=transport)
+        extracted = extractor.run(limit_letters=1)
+        return [e['id'] for e in extracted], extractor.db.get_entry('Α_main')['content']['text']
+
+def test_extractor_skips_stored_entries(tmp_path):
+    """Entries stored by an earlier run are not extracted again"""
+    ids, text = _extract_first_letter(tmp_path, refresh=False)
+    assert 'Α_main' not in ids
+    assert text == 'old'
+
+def test_extractor_refresh_extracts_stored_entries(tmp_path):
+    """A refresh run extracts and overwrites entries stored by an earlier run"""
+    ids, text = _extract_first_letter(tmp_path, refresh=True)
+    assert 'Α_main' in ids
+    assert text == 'new'
@@ -1,5 +1,5 @@
 import asyncio
-from scraper import LogeionScraper
+from src.scraper import _BASE_LETTERS, LogeionScraper, _parse_api_detail
 import json
 import pytest
 import aiosqlite
@@ -102,5 +102,30 @@ async def test_db_insert():
             assert row[2] == test_data['language']
             assert row[3] == test_data['details']
 
+def test_parse_api_detail():
+    """Definitions and de-duplicated related forms come out of an API detail response"""
+    data = {'detail': {'dicos': [
+        {'dname': ' LSJ ', 'es': ['<p>good, <a class="greek" href="/ἀγαθότης">ἀγαθότης</a></p>']},
+        {'dname': 'Middle Liddell', 'es': ['<p>good <a class="greek" href="/ἀγαθότης">ἀγαθότης</a></p>']},
+    ]}}
+
+    entry = _parse_api_detail(data)
+    assert [d['source'] for d in entry['definitions']] == ['LSJ', 'Middle Liddell']
+    assert entry['definitions'][0]['definition'] == 'good, ἀγαθότης'
+    assert entry['related_forms'] == ['ἀγαθότης']
+    assert _parse_api_detail(data, keep_html=False)['definitions'][0]['html'] == ''
+
+@pytest.mark.parametrize('data', [None, [], {}, {'detail': None}, {'detail': {'dicos': []}}])
+def test_parse_api_detail_without_definitions(data):
+    """Responses without definitions fall back to the browser"""
+    assert _parse_api_detail(data) is None
+
+@pytest.mark.parametrize('lemma, letter', [
+    ('ἀγαθός', 'α'), ('Ἀθῆναι', 'α'), ('ᾅδης', 'α'), ('ὕδωρ', 'υ'), ('ῥέω', 'ρ'), ('Ω', 'ω'), ('λόγος', 'λ'),
+])
+def test_base_letters(lemma, letter):
+    """A lemma's initial maps to its bare lowercase base letter"""
+    assert lemma[:1].translate(_BASE_LETTERS) == letter
+
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file